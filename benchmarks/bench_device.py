@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark device sessions against simulated devices on loopback.
+
+Reports handshake time, command round trip time, reconnect time, command
+throughput and memory per device, for each fleet size, as JSON:
+
+    python -m benchmarks.bench_device --sizes 1 10 100 1000 -o bench.json
+
+Simulated devices run on the same event loop as the devices under test,
+so absolute numbers include the simulator's own overhead.
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import Dict, List
+
+from pysonofflan import SonoffFleet
+from pysonofflan.simulator import start_devices, stop_devices
+
+from .common import percentiles, raise_file_limit, write_report
+
+
+async def wait_reconnected(device, start: float,
+                           samples: List[float]) -> None:
+    await device.client.disconnected_event.wait()
+    await device.client.connected_event.wait()
+    samples.append(time.monotonic() - start)
+
+
+async def run_commands(device, count: int, samples: List[float]) -> None:
+    for index in range(count):
+        if index % 2:
+            samples.append(await device.turn_off(timeout=30))
+        else:
+            samples.append(await device.turn_on(timeout=30))
+
+
+async def benchmark_fleet(fleet: SonoffFleet, size: int, commands: int,
+                          latency: float, timeout: float) -> Dict:
+    simulated = await start_devices(size, latency=latency)
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+
+    waiters = []
+    for simulated_device in simulated:
+        device = fleet.add_device('127.0.0.1', port=simulated_device.port)
+        waiters.append(device.client.connected_event.wait())
+    await asyncio.wait_for(asyncio.gather(*waiters), timeout)
+
+    # Each device times its own handshake from its connection attempt, so
+    # devices waiting for a handshake slot are not charged for the wait
+    handshakes = [device.stats()['handshake_seconds']['max']
+                  for device in fleet.devices]
+
+    memory_per_device = (tracemalloc.get_traced_memory()[0]
+                         - memory_before) / size
+    tracemalloc.stop()
+
+    rtts = []
+    start = time.monotonic()
+    await asyncio.wait_for(asyncio.gather(
+        *(run_commands(device, commands, rtts)
+          for device in fleet.devices)), timeout)
+    command_time = time.monotonic() - start
+
+    reconnects = []
+    start = time.monotonic()
+    waiters = asyncio.gather(*(wait_reconnected(device, start, reconnects)
+                               for device in fleet.devices))
+    await asyncio.gather(*(device.disconnect() for device in simulated))
+    await asyncio.wait_for(waiters, timeout)
+
+    await fleet.shutdown()
+    await stop_devices(simulated)
+
+    return {
+        'devices': size,
+        'commands_per_device': commands,
+        'simulated_latency': latency,
+        'handshake_seconds': percentiles(handshakes),
+        'command_rtt_seconds': percentiles(rtts),
+        'reconnect_seconds': percentiles(reconnects),
+        'commands_per_second': len(rtts) / command_time,
+        'memory_per_device_bytes': memory_per_device,
+    }
+
+
+def main(args=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1, 10, 100, 1000],
+                        help='fleet sizes to benchmark')
+    parser.add_argument('--commands', type=int, default=20,
+                        help='commands sent to each device')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='simulated device reply latency in seconds')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='seconds allowed for each phase')
+    parser.add_argument('-o', '--output', default=None,
+                        help='file to write JSON results to')
+    options = parser.parse_args(args)
+
+    raise_file_limit()
+
+    results = []
+    for size in options.sizes:
+        fleet = SonoffFleet()
+        try:
+            results.append(fleet.run_until_complete(benchmark_fleet(
+                fleet, size, options.commands, options.latency,
+                options.timeout)))
+        finally:
+            fleet.close()
+
+    write_report('device', results, options.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark network discovery strategies on a loopback network.
+
+Simulated devices listen on a sparse set of 127.x.y.z addresses, and every
+other address in the swept network refuses the connection. Each strategy
+sweeps /24, /22 and /20 networks and reports wall time, devices found and
+peak threads, tasks and file descriptors, as JSON:
+
+    python -m benchmarks.bench_discover --concurrency 64 256 1024
+
+The "threads" strategy is the thread-per-address scanner pysonofflan used
+before discovery moved onto asyncio, kept here as a baseline. Closed ports
+on loopback refuse immediately, so probe timeouts are not exercised.
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, List
+
+from pysonofflan import Discover
+from pysonofflan.simulator import SimulatedDevice
+
+from .common import raise_file_limit, write_report
+
+LEGACY_MAX_THREADS = 128
+
+try:
+    all_tasks = asyncio.all_tasks
+except AttributeError:
+    # Python 3.6, which also returns tasks which are done
+    def all_tasks(loop):
+        return {task for task in asyncio.Task.all_tasks(loop)
+                if not task.done()}
+
+
+def open_files() -> int:
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return 0
+
+
+class Sampler:
+    """Track peak thread and file descriptor counts from a background
+    thread, and peak task count from the scanning event loop."""
+
+    def __init__(self, loop, interval: float = 0.005) -> None:
+        self.loop = loop
+        self.interval = interval
+        self.base_threads = threading.active_count()
+        self.base_files = open_files()
+        self.peak_threads = 0
+        self.peak_files = 0
+        self.peak_tasks = 0
+        self.running = False
+        self.thread = None
+        self.task = None
+
+    def sample(self) -> None:
+        while self.running:
+            self.peak_threads = max(
+                self.peak_threads,
+                threading.active_count() - self.base_threads)
+            self.peak_files = max(self.peak_files,
+                                  open_files() - self.base_files)
+            time.sleep(self.interval)
+
+    async def sample_tasks(self) -> None:
+        while True:
+            # Exclude this sampling task itself
+            self.peak_tasks = max(self.peak_tasks,
+                                  len(all_tasks(self.loop)) - 1)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self.running = True
+        # Started before the sampler thread so it is not counted
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.base_threads += 1
+        self.thread.start()
+        self.task = asyncio.ensure_future(self.sample_tasks(), loop=self.loop)
+
+    async def stop(self) -> None:
+        self.running = False
+        self.thread.join()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+def legacy_probe_ip(ip, devices: Dict, timeout: float, port: int) -> None:
+    tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tcp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    tcp_sock.settimeout(timeout)
+    try:
+        if tcp_sock.connect_ex((str(ip), port)) == 0:
+            devices[str(ip)] = str(ip)
+    finally:
+        tcp_sock.close()
+
+
+async def legacy_discover(network: str, timeout: float,
+                          port: int) -> Dict[str, str]:
+    """Start threads in batches of LEGACY_MAX_THREADS, joining each batch
+    before starting the next, blocking the event loop throughout."""
+    devices = {}
+    addresses = list(ipaddress.IPv4Network(network))
+
+    for index in range(0, len(addresses), LEGACY_MAX_THREADS):
+        threads = [threading.Thread(target=legacy_probe_ip,
+                                    args=(ip, devices, timeout, port))
+                   for ip in addresses[index:index + LEGACY_MAX_THREADS]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return devices
+
+
+def start_listeners(network: str, spacing: int, port: int):
+    """
+    Start simulated devices on every `spacing`th host of the network, on
+    their own event loop in a background thread so they keep answering
+    while a blocking strategy runs.
+    """
+    loop = asyncio.new_event_loop()
+    hosts = list(ipaddress.IPv4Network(network).hosts())[::spacing]
+    devices = [SimulatedDevice(host=str(host), port=port) for host in hosts]
+    loop.run_until_complete(
+        asyncio.gather(*(device.start() for device in devices), loop=loop))
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    return loop, thread, devices
+
+
+async def stop_devices(devices: List[SimulatedDevice]) -> None:
+    await asyncio.gather(*(device.stop() for device in devices))
+
+
+def stop_listeners(loop, thread, devices: List[SimulatedDevice]) -> None:
+    asyncio.run_coroutine_threadsafe(stop_devices(devices), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def get_strategies(concurrencies: List[int], timeout: float,
+                   confirm: bool, legacy: bool,
+                   port: int) -> Dict[str, Callable]:
+    strategies = {}
+
+    if legacy:
+        strategies['threads-%i' % LEGACY_MAX_THREADS] = (
+            lambda network: legacy_discover(network, timeout, port))
+
+    for concurrency in concurrencies:
+        strategies['asyncio-%i' % concurrency] = (
+            lambda network, concurrency=concurrency: Discover.discover(
+                network=network, concurrency=concurrency, timeout=timeout,
+                confirm=confirm))
+
+    return strategies
+
+
+def benchmark_strategy(loop, name: str, strategy: Callable, network: str,
+                       expected: int) -> Dict:
+    sampler = Sampler(loop)
+    sampler.start()
+
+    start = time.monotonic()
+    devices = loop.run_until_complete(strategy(network))
+    elapsed = time.monotonic() - start
+
+    loop.run_until_complete(sampler.stop())
+
+    return {
+        'strategy': name,
+        'network': network,
+        'addresses': ipaddress.IPv4Network(network).num_addresses,
+        'listeners': expected,
+        'found': len(devices),
+        'wall_seconds': elapsed,
+        'peak_threads': sampler.peak_threads,
+        'peak_tasks': sampler.peak_tasks,
+        'peak_open_files': sampler.peak_files,
+    }
+
+
+def main(args=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--prefixes', type=int, nargs='+',
+                        default=[24, 22, 20],
+                        help='prefix lengths of the networks to sweep')
+    parser.add_argument('--base', default='127.1.0.0',
+                        help='first address of the swept networks')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[64, Discover.DEFAULT_CONCURRENCY, 1024],
+                        help='asyncio scanner concurrency limits to compare')
+    parser.add_argument('--spacing', type=int, default=64,
+                        help='start a simulated device on every nth host')
+    parser.add_argument('--port', type=int, default=Discover.SONOFF_PORT,
+                        help='port the simulated devices listen on')
+    parser.add_argument('--timeout', type=float,
+                        default=Discover.PROBE_TIMEOUT,
+                        help='seconds to wait for each connection attempt')
+    parser.add_argument('--confirm', action='store_true',
+                        help='perform the LAN mode handshake with each '
+                             'open host (asyncio strategies only)')
+    parser.add_argument('--no-legacy', dest='legacy', action='store_false',
+                        help='skip the thread per address baseline')
+    parser.add_argument('-o', '--output', default=None,
+                        help='file to write JSON results to')
+    options = parser.parse_args(args)
+
+    raise_file_limit()
+
+    strategies = get_strategies(options.concurrency, options.timeout,
+                                options.confirm, options.legacy,
+                                options.port)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # Discover has no port argument, so point it at the simulated devices
+    # for the duration of the benchmark only
+    default_port = Discover.SONOFF_PORT
+    Discover.SONOFF_PORT = options.port
+
+    results = []
+    try:
+        for prefix in options.prefixes:
+            network = '%s/%i' % (options.base, prefix)
+            listeners = start_listeners(network, options.spacing,
+                                        options.port)
+            try:
+                for name, strategy in strategies.items():
+                    results.append(benchmark_strategy(
+                        loop, name, strategy, network, len(listeners[2])))
+            finally:
+                stop_listeners(*listeners)
+    finally:
+        Discover.SONOFF_PORT = default_port
+        loop.close()
+
+    write_report('discover', results, options.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""Helpers shared by the benchmark scripts."""
+
+import json
+import math
+import platform
+import resource
+import sys
+from typing import Dict, List
+
+import pysonofflan
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summarise samples with nearest-rank percentiles."""
+    if not samples:
+        return {}
+
+    ordered = sorted(samples)
+
+    def rank(percent):
+        index = max(0, math.ceil(percent * len(ordered) / 100) - 1)
+        return ordered[index]
+
+    return {
+        'count': len(ordered),
+        'min': ordered[0],
+        'p50': rank(50),
+        'p95': rank(95),
+        'p99': rank(99),
+        'max': ordered[-1],
+    }
+
+
+def raise_file_limit() -> None:
+    """Allow as many open sockets as the hard limit permits."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def write_report(name: str, results: List[Dict], output: str = None) -> None:
+    """Write results as JSON, with enough context to compare releases."""
+    report = {
+        'benchmark': name,
+        'pysonofflan': pysonofflan.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
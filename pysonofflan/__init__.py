@@ -44,6 +44,13 @@ initialised, for example:
         callback_after_update=state_callback
     )
 
+To run devices on an event loop you manage, without blocking when they
+are created, start and stop them explicitly:
+
+    async with SonoffSwitch("192.168.1.50", autostart=False) as switch:
+        await switch.client.connected_event.wait()
+        await switch.turn_on()
+
 Module-specific errors are raised as Exceptions and are expected
 to be handled by the user of the library.
 """
@@ -54,7 +61,16 @@ __version__ = '0.3.0'
 __url__ = 'https://github.com/beveradb/pysonofflan'
 
 # flake8: noqa
+from .breaker import CircuitBreaker
+from .cache import DiscoveryCache
 from .client import SonoffLANModeClient
-from .discover import Discover
+from .discover import Discover, ScanPlanner
+from .mdns import MDNSDiscovery
+from .metrics import MetricsRegistry, MetricsServer
+from .reconnect import ReconnectPolicy
+from .snapshot import StateSnapshot
+from .telemetry import TelemetryBuffer
 from .sonoffdevice import SonoffDevice
 from .sonoffswitch import SonoffSwitch
+from .sonoffmultiswitch import SonoffMultiSwitch
+from .fleet import SonoffFleet
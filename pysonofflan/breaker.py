@@ -0,0 +1,93 @@
+import enum
+import time
+
+
+class CircuitState(enum.Enum):
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+
+
+# Values of the circuit_state gauge exported with device metrics
+CIRCUIT_STATE_VALUES = {
+    CircuitState.CLOSED: 0,
+    CircuitState.HALF_OPEN: 1,
+    CircuitState.OPEN: 2,
+}
+
+
+class CircuitBreaker:
+    """
+    Track whether a device is worth connecting to.
+
+    The circuit starts closed, and connections are retried with the usual
+    backoff. After `failure_threshold` consecutive failures it opens: no
+    websocket connections are attempted, only a cheap TCP probe of the
+    device port every `probe_interval` seconds. Once a probe succeeds the
+    circuit is half-open and one full handshake is attempted, closing the
+    circuit on success or opening it again on failure.
+
+    Usage example:
+    breaker = CircuitBreaker(failure_threshold=3, probe_interval=60)
+    switch = SonoffSwitch("192.168.1.50", circuit_breaker=breaker)
+    print(switch.circuit_state)
+    """
+
+    def __init__(self,
+                 failure_threshold: int = 5,
+                 probe_interval: float = 30,
+                 probe_timeout: float = 1) -> None:
+        """
+        Create a new CircuitBreaker instance.
+
+        :param failure_threshold: consecutive connection failures which
+                                  open the circuit
+        :param probe_interval: seconds between TCP probes while open
+        :param probe_timeout: seconds to wait for each TCP probe
+        """
+        if failure_threshold < 1:
+            raise ValueError('failure_threshold must be at least 1')
+
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.state is CircuitState.OPEN
+
+    def record_success(self) -> None:
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> bool:
+        """
+        Count a failed connection attempt.
+
+        :return: True if this failure opened the circuit
+        """
+        self.failures += 1
+
+        if self.state is CircuitState.OPEN:
+            return False
+
+        if (self.state is CircuitState.HALF_OPEN
+                or self.failures >= self.failure_threshold):
+            self.state = CircuitState.OPEN
+            self.opened_at = time.monotonic()
+            return True
+
+        return False
+
+    def record_probe_success(self) -> None:
+        """Allow one handshake attempt after the device port answered."""
+        if self.state is CircuitState.OPEN:
+            self.state = CircuitState.HALF_OPEN
+
+    def __repr__(self):
+        return "<%s %s failures=%i>" % (
+            self.__class__.__name__, self.state.value, self.failures)
@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+
+def default_cache_path(variable: str, filename: str) -> str:
+    """
+    Path of a file in the pysonofflan cache directory, under
+    $XDG_CACHE_HOME or ~/.cache, unless overridden by an environment
+    variable.
+
+    :param variable: environment variable holding the full path, if set
+    :param filename: name of the file in the cache directory
+    """
+    if variable in os.environ:
+        return os.environ[variable]
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'pysonofflan', filename)
+
+
+def write_atomic(path: str, content: str) -> None:
+    """
+    Write a file through a temporary file, so that readers see either the
+    previous or the new content, never a partial file.
+
+    :raises OSError: if the file could not be written
+    """
+    temp_path = path + '.tmp'
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(temp_path, 'w') as temp_file:
+        temp_file.write(content)
+    os.replace(temp_path, path)
+
+
+class DiscoveryCache:
+    """
+    On-disk cache mapping device IDs to the IP address they were last seen
+    at, so a known device can be found again without scanning the network.
+
+    Usage example:
+    cache = DiscoveryCache()
+    host = cache.get("100040e943")
+    """
+    DEFAULT_TTL = 24 * 60 * 60
+
+    def __init__(self, path: str = None, ttl: float = DEFAULT_TTL,
+                 logger=None) -> None:
+        """
+        Create a new DiscoveryCache instance.
+
+        :param path: JSON file to store the cache in, defaults to
+                     $PYSONOFFLAN_CACHE or ~/.cache/pysonofflan/devices.json
+        :param ttl: Seconds after which a cached address must be rescanned
+        """
+        self.path = path or self.default_path()
+        self.ttl = ttl
+        self.entries = None
+
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+    @staticmethod
+    def default_path() -> str:
+        return default_cache_path('PYSONOFFLAN_CACHE', 'devices.json')
+
+    def load(self) -> Dict[str, Dict]:
+        if self.entries is None:
+            try:
+                with open(self.path) as cache_file:
+                    entries = json.load(cache_file)
+
+                if not isinstance(entries, dict):
+                    raise ValueError('not a JSON object')
+
+                self.entries = entries
+            except (OSError, ValueError) as ex:
+                self.logger.debug("Not using discovery cache %s: %s",
+                                  self.path, ex)
+                self.entries = {}
+
+        return self.entries
+
+    def save(self) -> None:
+        """
+        Write the cache to disk, replacing the previous file atomically.
+        """
+        try:
+            write_atomic(self.path, json.dumps(self.load()))
+        except OSError as ex:
+            self.logger.warning("Unable to save discovery cache %s: %s",
+                                self.path, ex)
+
+    def get(self, device_id: str) -> Optional[str]:
+        """
+        Return the cached host for a device, or None if it is unknown or
+        its entry is older than the TTL.
+        """
+        entry = self.load().get(device_id.lower())
+
+        try:
+            if entry is None or time.time() - entry['last_seen'] > self.ttl:
+                return None
+
+            return entry['host']
+
+        except (KeyError, TypeError, AttributeError) as ex:
+            self.logger.debug("Ignoring invalid discovery cache entry for "
+                              "%s: %s", device_id, ex)
+            return None
+
+    def set(self, device_id: str, host: str) -> None:
+        self.load()[device_id.lower()] = {
+            'host': host,
+            'last_seen': time.time()
+        }
+
+    def remove(self, device_id: str) -> None:
+        self.load().pop(device_id.lower(), None)
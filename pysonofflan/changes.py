@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple
+
+from .commands import merge_params
+
+
+# A param reported by a device with a new value
+ParamChange = NamedTuple('ParamChange', [
+    ('key', str),
+    ('old', Any),
+    ('new', Any)
+])
+
+
+def diff_params(old: Dict, new: Dict) -> List[ParamChange]:
+    """
+    Changes between two sets of params, for each key in `new` whose value
+    differs from `old`. Keys missing from `new` are left out rather than
+    reported as removed, as devices may announce only the params which
+    changed.
+    """
+    return [ParamChange(key, old.get(key), value)
+            for key, value in new.items()
+            if key not in old or old[key] != value]
+
+
+class ChangeTracker:
+    """
+    Keep the params last reported by a device, and notify subscribers and
+    event streams of each param which changed, once per change, so they
+    need not compare whole states themselves.
+
+    Usage example:
+    async def power_changed(device, change):
+        print(change.key, change.old, change.new)
+
+    unsubscribe = device.subscribe(power_changed, "power", "current")
+    """
+
+    def __init__(self, logger=None) -> None:
+        self.params = {}
+        self.subscribers = []
+        self.streams = []
+
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+    def subscribe(self,
+                  handler: Callable[..., Awaitable[None]],
+                  *keys: str) -> Callable[[], None]:
+        """
+        Call a handler with the device and a ParamChange for every change
+        to one of the given params, or to any param if none are given.
+
+        :return: function which cancels the subscription
+        """
+        subscriber = (handler, frozenset(keys) or None)
+        self.subscribers.append(subscriber)
+
+        def unsubscribe():
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+        return unsubscribe
+
+    def add_stream(self, stream) -> None:
+        self.streams.append(stream)
+
+    def remove_stream(self, stream) -> None:
+        if stream in self.streams:
+            self.streams.remove(stream)
+
+    def close_streams(self) -> None:
+        for stream in list(self.streams):
+            stream.close()
+
+    def update(self, params: Dict) -> List[ParamChange]:
+        """
+        Record params reported by the device.
+
+        :return: the params which changed
+        """
+        merged = merge_params(self.params, params)
+        changes = diff_params(self.params,
+                              {key: merged[key] for key in params})
+        self.params = merged
+        return changes
+
+    async def notify(self, device, changes: List[ParamChange]) -> None:
+        """
+        Pass changes to the event streams and subscribers interested in
+        them. Event streams are never waited on, whatever their overflow
+        policy. An exception raised by one subscriber is logged, and does
+        not prevent the others from being notified.
+        """
+        for stream in list(self.streams):
+            for change in changes:
+                if stream.wants(change):
+                    stream.push(change)
+
+        for handler, keys in list(self.subscribers):
+            for change in changes:
+                if keys is not None and change.key not in keys:
+                    continue
+
+                try:
+                    await handler(device, change)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    self.logger.error(
+                        'Error in change subscriber %s for %s: %s',
+                        handler, change.key, ex)
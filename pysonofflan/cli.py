@@ -6,7 +6,8 @@ import click
 import click_log
 from click_log import ClickHandler
 
-from pysonofflan import (SonoffSwitch, Discover)
+from pysonofflan import (SonoffSwitch, Discover, DiscoveryCache,
+                         ScanPlanner)
 
 if sys.version_info < (3, 5):
     print("To use this script you need python 3.5 or newer! got %s" %
@@ -68,12 +69,12 @@ def cli(ctx, host, device_id, inching):
 
     if device_id is not None and host is None:
         logger.info(
-            "Device ID is given, using discovery to find host %s" % device_id)
+            "Device ID is given, using discovery to find host %s", device_id)
         host = find_host_from_device_id(device_id=device_id)
         if host:
-            logger.info("Matching Device ID found! IP: %s" % host)
+            logger.info("Matching Device ID found! IP: %s", host)
         else:
-            logger.info("No device with name %s found" % device_id)
+            logger.info("No device with name %s found", device_id)
             return
 
     if host is None:
@@ -85,17 +86,34 @@ def cli(ctx, host, device_id, inching):
 
 
 @cli.command()
-@click.option('--network', default=None, help='Network address to scan, ex: 192.168.0.0/24')
-def discover(network):
+@click.option('--network', multiple=True,
+              help='Network address to scan, ex: 192.168.0.0/24. '
+                   'May be given more than once.')
+@click.option('--exclude', multiple=True,
+              help='Network or IP address to skip. May be given more '
+                   'than once.')
+@click.option('--rate', type=float, default=None,
+              help='Maximum connection attempts per second per network.')
+def discover(network, exclude, rate):
     """Discover devices in the network (takes ~1 minute)."""
     logger.info(
         "Attempting to discover Sonoff LAN Mode devices "
         "on the local network, please wait..."
     )
+
+    planner = ScanPlanner(network or Discover.DEFAULT_NETWORKS,
+                          exclude=exclude, rate=rate)
+
+    async def print_devices():
+        devices = {}
+        async for ip, found_device_id in Discover.iter_discover(planner,
+                                                                logger):
+            logger.info("Found Sonoff LAN Mode device at IP %s", ip)
+            devices[ip] = found_device_id or ip
+        return devices
+
     found_devices = asyncio.get_event_loop().run_until_complete(
-        Discover.discover(logger, network)).items()
-    for ip, found_device_id in found_devices:
-        logger.info("Found Sonoff LAN Mode device at IP %s" % ip)
+        print_devices()).items()
 
     return found_devices
 
@@ -105,36 +123,10 @@ def find_host_from_device_id(device_id):
     logger.info(
         "Trying to discover %s by scanning for devices "
         "on local network, please wait..." % device_id)
-    found_devices = asyncio.get_event_loop().run_until_complete(
-        Discover.discover(logger)).items()
-    for ip, _ in found_devices:
-        logger.info("Found Sonoff LAN Mode device at IP %s, attempting to "
-                    "read state to get device ID" % ip)
-
-        shared_state = {'device_id_at_current_ip': None}
 
-        async def device_id_callback(device: SonoffSwitch):
-            if device.basic_info is not None:
-                device.shared_state['device_id_at_current_ip'] = \
-                    device.device_id
-                device.shutdown_event_loop()
-
-        SonoffSwitch(
-            host=ip,
-            callback_after_update=device_id_callback,
-            shared_state=shared_state,
-            logger=logger
-        )
-
-        current_device_id = shared_state['device_id_at_current_ip']
-
-        if device_id.lower() == current_device_id.lower():
-            return ip
-        else:
-            logger.info(
-                "Found device ID %s which did not match" % current_device_id
-            )
-    return None
+    return asyncio.get_event_loop().run_until_complete(
+        Discover.find_device(device_id, logger=logger,
+                             cache=DiscoveryCache(logger=logger)))
 
 
 @cli.command()
@@ -149,7 +141,7 @@ def state(config: dict):
 
                 device.shutdown_event_loop()
 
-    logger.info("Initialising SonoffSwitch with host %s" % config['host'])
+    logger.info("Initialising SonoffSwitch with host %s", config['host'])
     SonoffSwitch(
         host=config['host'],
         callback_after_update=state_callback,
@@ -186,7 +178,7 @@ def listen(config: dict):
 
         self.shared_state['callback_counter'] += 1
 
-    logger.info("Initialising SonoffSwitch with host %s" % config['host'])
+    logger.info("Initialising SonoffSwitch with host %s", config['host'])
 
     shared_state = {'callback_counter': 0}
     SonoffSwitch(
@@ -213,7 +205,7 @@ def print_device_details(device):
 
 
 def switch_device(host, inching, new_state):
-    logger.info("Initialising SonoffSwitch with host %s" % host)
+    logger.info("Initialising SonoffSwitch with host %s", host)
 
     async def update_callback(device: SonoffSwitch):
         if device.basic_info is not None:
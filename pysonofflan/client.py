@@ -1,15 +1,19 @@
 import binascii
-import json
 import logging
 import random
 import time
-from typing import Dict, Union, Callable, Awaitable
+from typing import Dict, Union, Callable, Awaitable, NamedTuple
 import asyncio
 import enum
 
 import websockets
 from websockets.framing import OP_CLOSE, parse_close, OP_PING, OP_PONG
 
+from .messages import (Message, MessageDispatcher, ResponseMessage,
+                       UnknownMessage, parse_message)
+from .metrics import MetricsRegistry
+from .serializer import Serializer, get_serializer
+
 logger = logging.getLogger(__name__)
 
 V6_DEFAULT_TIMEOUT = 10
@@ -18,6 +22,25 @@ V6_DEFAULT_PING_INTERVAL = 300
 # get only MAJOR.MINOR, discard whatever else comes afterward (ie: MICRO)
 WEBSOCKETS_VERSION = float('.'.join(websockets.__version__.split('.')[0:2]))
 
+Acknowledgement = NamedTuple('Acknowledgement', [
+    ('sequence', str),
+    ('response', Dict),
+    ('rtt', float)
+])
+
+
+class RequestError(Exception):
+    """
+    Exception raised when the device replies to a request with an error.
+    Provides the error code in its ``error`` attribute.
+    """
+
+    def __init__(self, error, response):
+        self.error = error
+        self.response = response
+        super().__init__("Device returned error %s" % error)
+
+
 class InvalidState(Exception):
     """
     Exception raised when an operation is forbidden in the current state.
@@ -80,6 +103,11 @@ def format_close(code, reason):
 class SonoffLANModeClientProtocol(websockets.WebSocketClientProtocol):
     """Customised WebSocket client protocol to ignore pong payload match."""
 
+    # MetricsRegistry to record ping round trip times in, set by the client
+    metrics = None
+    # Whether to log each ping and pong, set by the client
+    log_frames = True
+
     @asyncio.coroutine
     def read_data_frame(self, max_size):
         """
@@ -94,24 +122,27 @@ class SonoffLANModeClientProtocol(websockets.WebSocketClientProtocol):
                 return
 
             elif frame.opcode == OP_PING:
-                ping_hex = binascii.hexlify(frame.data).decode() or '[empty]'
-                logger.debug(
-                    "%s - received ping, sending pong: %s", self.side, ping_hex
-                )
+                if self.log_frames and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "%s - received ping, sending pong: %s", self.side,
+                        binascii.hexlify(frame.data).decode() or '[empty]'
+                    )
                 yield from self.pong(frame.data)
 
             elif frame.opcode == OP_PONG:
                 # Acknowledge pings on solicited pongs, regardless of payload
                 if self.pings:
-                    ping_id, pong_waiter = self.pings.popitem(0)
-                    ping_hex = binascii.hexlify(ping_id).decode() or '[empty]'
+                    # Oldest ping first, pings is a plain dict in websockets 8
+                    ping_id = next(iter(self.pings))
+                    pong_waiter = self.pings.pop(ping_id)
                     pong_waiter.set_result(None)
-                    logger.debug(
-                        "%s - received pong, clearing most recent ping: %s",
-                        self.side,
-                        ping_hex
-                    )
-                else:
+                    if self.log_frames and logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(
+                            "%s - received pong, clearing most recent ping: "
+                            "%s", self.side,
+                            binascii.hexlify(ping_id).decode() or '[empty]'
+                        )
+                elif self.log_frames:
                     logger.debug(
                         "%s - received pong, but no pings to clear",
                         self.side
@@ -119,6 +150,22 @@ class SonoffLANModeClientProtocol(websockets.WebSocketClientProtocol):
             else:
                 return frame
 
+    @asyncio.coroutine
+    def ping(self, data=None):
+        sent_time = time.monotonic()
+        pong_waiter = yield from super().ping(data)
+
+        if self.metrics is not None:
+            ping_rtt = self.metrics.histogram('ping_rtt_seconds')
+
+            def record_rtt(waiter):
+                if not waiter.cancelled() and waiter.exception() is None:
+                    ping_rtt.observe(time.monotonic() - sent_time)
+
+            pong_waiter.add_done_callback(record_rtt)
+
+        return pong_waiter
+
     def __init__(self, **kwds):
 
         logger.debug("__init__()" )
@@ -156,7 +203,7 @@ class SonoffLANModeClientProtocol(websockets.WebSocketClientProtocol):
 
         if WEBSOCKETS_VERSION >= 7.0:
 
-            super().keepalive_ping()
+            yield from super().keepalive_ping()
 
         else:
 
@@ -287,35 +334,58 @@ class SonoffLANModeClient:
     DEFAULT_PORT = 8081
     DEFAULT_TIMEOUT = 5
     DEFAULT_PING_INTERVAL = 5
+    last_sequence = 0
 
     """
     Initialise class with connection parameters
 
     :param str host: host name or ip address of the device
+    :param event_handler: coroutine called with each message from the device
+                          of a type with no handler registered with the
+                          client's dispatcher
     :param int port: port on the device (default: 8081)
     :return:
     """
 
     def __init__(self, host: str,
-                 event_handler: Callable[[str], Awaitable[None]],
+                 event_handler: Callable[[Message], Awaitable[None]] = None,
                  port: int = DEFAULT_PORT,
                  ping_interval: int = DEFAULT_PING_INTERVAL,
                  timeout: int = DEFAULT_TIMEOUT,
-                 logger: logging.Logger = None):
+                 logger: logging.Logger = None,
+                 metrics: MetricsRegistry = None,
+                 log_messages: bool = True,
+                 serializer: Serializer = None):
         self.host = host
         self.port = port
         self.ping_interval = ping_interval
         self.timeout = timeout
         self.logger = logger
         self.websocket = None
-        self.event_handler = event_handler
+        self.dispatcher = MessageDispatcher(event_handler, logger=logger)
         self.connected_event = asyncio.Event()
         self.disconnected_event = asyncio.Event()
-
+        self.pending_requests = {}
+        self.metrics = metrics
+        self.log_messages = log_messages
+        self.serializer = serializer or get_serializer()
 
         if self.logger is None:
             self.logger = logging.getLogger(__name__)
 
+        if self.metrics is None:
+            self.metrics = MetricsRegistry({'host': host})
+
+        self.metrics.counter('connections_attempted',
+                             'Websocket connections attempted')
+        self.metrics.counter('connections_failed',
+                             'Websocket connections which failed to open')
+        self.metrics.counter('messages_sent', 'Messages sent to the device')
+        self.metrics.counter('messages_received',
+                             'Messages received from the device')
+        self.metrics.histogram('ping_rtt_seconds',
+                               'Keepalive ping round trip time')
+
     async def connect(self):
         """
         Connect to the Sonoff LAN Mode Device and set up communication channel.
@@ -323,6 +393,7 @@ class SonoffLANModeClient:
         websocket_address = 'ws://%s:%s/' % (self.host, self.port)
         self.logger.debug('Connecting to websocket address: %s',
                           websocket_address)
+        self.metrics.counter('connections_attempted').inc()
 
         try:
             if WEBSOCKETS_VERSION >= 7.0:
@@ -330,6 +401,7 @@ class SonoffLANModeClient:
                     websocket_address,
                     ping_interval=self.ping_interval,
                     ping_timeout=self.timeout,
+                    close_timeout=self.timeout,
                     subprotocols=['chat'],
                     klass=SonoffLANModeClientProtocol
                 )
@@ -341,13 +413,32 @@ class SonoffLANModeClient:
                     klass=SonoffLANModeClientProtocol
                 )
         except websockets.InvalidMessage as ex:
-            self.logger.error('SonoffLANModeClient connection failed: %s' % ex)
+            self.metrics.counter('connections_failed').inc()
+            self.logger.error('SonoffLANModeClient connection failed: %s', ex)
             raise ex
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.metrics.counter('connections_failed').inc()
+            raise
+
+        self.websocket.metrics = self.metrics
+        self.websocket.log_frames = self.log_messages
+
+    @property
+    def debug_messages(self) -> bool:
+        """
+        Whether to log diagnostics for each message: only if log_messages
+        is enabled and the logger would emit debug records. The level check
+        is cached by the logging module until levels are changed.
+        """
+        return self.log_messages and self.logger.isEnabledFor(logging.DEBUG)
 
     async def close_connection(self):
         self.logger.debug('Closing websocket from client close_connection')
         self.connected_event.clear()
         self.disconnected_event.set()
+        self.fail_pending_requests()
         if self.websocket is not None:
             self.logger.debug('calling websocket.close')
             await self.websocket.close()
@@ -357,24 +448,27 @@ class SonoffLANModeClient:
     async def receive_message_loop(self):
         try:
             while True:
-                self.logger.debug('Waiting for messages on websocket')
-                message = await self.websocket.recv()
-                await self.event_handler(message)
-                self.logger.debug('Message passed to handler, should loop now')
+                debug = self.debug_messages
+                if debug:
+                    self.logger.debug('Waiting for messages on websocket')
+                frame = await self.websocket.recv()
+                await self.handle_frame(frame)
+                if debug:
+                    self.logger.debug(
+                        'Message passed to handler, should loop now')
         finally:
             self.logger.debug('receive_message_loop finally block reached')
 
     async def send_online_message(self):
         self.logger.debug('Sending user online message over websocket')
 
-        json_data = json.dumps(self.get_user_online_payload())
+        json_data = self.serializer.dumps(self.get_user_online_payload())
         await self.websocket.send(json_data)
+        self.metrics.counter('messages_sent').inc()
 
-        response_message = await self.websocket.recv()
-        response = json.loads(response_message)
+        response = await self.handle_frame(await self.websocket.recv())
 
-        self.logger.debug('Received user online response:')
-        self.logger.debug(response)
+        self.logger.debug('Received user online response: %s', response)
         # Example user online response:
         # {
         #     "error": 0,
@@ -383,14 +477,12 @@ class SonoffLANModeClient:
         #     "deviceid": "100040e943"
         # }
 
-        # We want to pass the event to the event_handler already
-        # because the hello event could arrive before the user online
-        # confirmation response
-        await self.event_handler(response_message)
-
+        # The message has already been dispatched to its handler, because
+        # the hello event could arrive before the user online confirmation
+        # response
         if (
-            ('error' in response and response['error'] == 0)
-            and 'deviceid' in response
+            isinstance(response, ResponseMessage) and response.ok
+            and response.device_id is not None
         ):
             self.logger.debug(
                 'Websocket connected and accepted online user OK')
@@ -398,19 +490,115 @@ class SonoffLANModeClient:
         else:
             self.logger.error('Websocket connection online user failed')
 
-    async def send(self, request: Union[str, Dict]):
+    async def send(self, request: Union[str, Dict]) -> asyncio.Future:
         """
-        Send message to an already-connected Sonoff LAN Mode Device
-        and return the response.
+        Send message to an already-connected Sonoff LAN Mode Device.
+
+        Requests are tracked by their sequence number, so several can be in
+        flight on one connection at a time.
 
         :param request: command to send to the device (can be dict or json)
-        :return:
+        :return: Future resolving to an Acknowledgement when the device
+                 replies to this request, or raising RequestError if the
+                 device reports an error
         """
         if isinstance(request, dict):
-            request = json.dumps(request)
+            sequence = request.get('sequence')
+            request = self.serializer.dumps(request)
+        else:
+            sequence = self.serializer.loads(request).get('sequence')
+
+        acknowledged = asyncio.get_event_loop().create_future()
+
+        if sequence is not None:
+            self.pending_requests[sequence] = (acknowledged, time.monotonic())
+            acknowledged.add_done_callback(
+                lambda _: self.pending_requests.pop(sequence, None))
+
+        if self.debug_messages:
+            self.logger.debug('Sending websocket message: %s', request)
+        try:
+            await self.websocket.send(request)
+        except Exception:
+            acknowledged.cancel()
+            raise
+
+        self.metrics.counter('messages_sent').inc()
+
+        return acknowledged
+
+    async def handle_frame(self, frame: Union[str, bytes]) -> Message:
+        """
+        Decode a frame received from the device into a typed message,
+        resolve the request it replies to, if any, then dispatch it to the
+        handler registered for its type.
+
+        Frames which cannot be decoded are dispatched as UnknownMessage,
+        rather than ending the receive loop.
+        """
+        self.metrics.counter('messages_received').inc()
+
+        try:
+            message = parse_message(self.serializer.loads(frame))
+        except ValueError:
+            self.logger.warning('Could not decode message from device: %s',
+                                frame)
+            message = UnknownMessage({'frame': frame})
+
+        self.handle_response(message)
+        await self.dispatcher.dispatch(message)
+        return message
+
+    def handle_response(self, message: Message) -> bool:
+        """
+        Resolve the pending request matching the sequence of a reply from
+        the device.
+
+        :return: True if the response acknowledged a pending request
+        """
+        if not isinstance(message, ResponseMessage):
+            return False
+
+        sequence = message.sequence
+        if sequence not in self.pending_requests:
+            return False
+
+        acknowledged, sent_time = self.pending_requests.pop(sequence)
+        if acknowledged.done():
+            return False
+
+        if message.ok:
+            acknowledged.set_result(Acknowledgement(
+                sequence, message.data, time.monotonic() - sent_time))
+        else:
+            acknowledged.set_exception(
+                RequestError(message.error, message.data))
+
+        return True
 
-        self.logger.debug('Sending websocket message: %s', request)
-        await self.websocket.send(request)
+    def fail_pending_requests(self):
+        """
+        Fail requests which will never be acknowledged, as the connection
+        they were sent on has closed.
+        """
+        pending_requests = self.pending_requests
+        self.pending_requests = {}
+
+        for acknowledged, _ in pending_requests.values():
+            if not acknowledged.done():
+                acknowledged.set_exception(websockets.ConnectionClosed(
+                    1006, 'connection closed before acknowledgement'))
+
+    @staticmethod
+    def get_sequence() -> str:
+        """
+        Get a millisecond timestamp to identify a request, as the eWeLink
+        app does, which is unique within this process.
+        """
+        sequence = max(int(time.time() * 1000),
+                       SonoffLANModeClient.last_sequence + 1)
+        SonoffLANModeClient.last_sequence = sequence
+        return str(sequence)
 
     @staticmethod
     def get_user_online_payload() -> Dict:
@@ -426,7 +614,7 @@ class SonoffLANModeClient:
             'ts': str(int(time.time())),
             'model': 'iPhone10,6',
             'romVersion': '11.1.2',
-            'sequence': str(time.time()).replace('.', '')
+            'sequence': SonoffLANModeClient.get_sequence()
         }
 
     @staticmethod
@@ -437,7 +625,7 @@ class SonoffLANModeClient:
             'params': params,
             'apikey': 'apikey',  # No apikey needed in LAN mode
             'deviceid': device_id,
-            'sequence': str(time.time()).replace('.', ''),
+            'sequence': SonoffLANModeClient.get_sequence(),
             'controlType': 4,
             'ts': 0
         }
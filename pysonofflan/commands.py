@@ -0,0 +1,132 @@
+import asyncio
+from typing import Dict, List, Tuple
+
+
+def merge_params(params: Dict, changes: Dict) -> Dict:
+    """
+    Apply param changes, returning a new dict. The "switches" list of
+    multi-channel devices is merged outlet by outlet, so a change to one
+    channel keeps the state of the others.
+    """
+    merged = dict(params)
+
+    for key, value in changes.items():
+        current = merged.get(key)
+        if (key == 'switches' and isinstance(current, list)
+                and isinstance(value, list)):
+            outlets = {entry.get('outlet'): entry for entry in current}
+            for entry in value:
+                outlets[entry.get('outlet')] = dict(
+                    outlets.get(entry.get('outlet'), {}), **entry)
+            merged[key] = sorted(outlets.values(),
+                                 key=lambda entry: entry.get('outlet') or 0)
+        else:
+            merged[key] = value
+
+    return merged
+
+
+def retrieve_exception(future: asyncio.Future) -> None:
+    # Callers may schedule changes without awaiting the result; mark
+    # failures as retrieved so they are not reported as unhandled
+    if not future.cancelled():
+        future.exception()
+
+
+class CommandQueue:
+    """
+    Param changes waiting to be sent to a device, coalesced into as few
+    update messages as possible.
+
+    Changes queued before a batch is taken are merged key by key, and
+    channel by channel for multi-channel devices, so later values replace
+    earlier ones and superseded toggles are never sent.
+    A batch taken for sending is frozen: changes queued while it is in
+    flight go into the next batch, so they always reach the device after
+    the changes that preceded them.
+    """
+
+    def __init__(self, loop=None) -> None:
+        self.loop = loop or asyncio.get_event_loop()
+        self.pending = {}
+        self.waiters = []
+        self.in_flight = False
+        self.updated_event = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    @property
+    def busy(self) -> bool:
+        """
+        Whether changes are waiting to be sent or awaiting acknowledgement.
+        """
+        return bool(self.pending) or self.in_flight
+
+    def merge(self, params: Dict) -> None:
+        self.pending = merge_params(self.pending, params)
+
+    def put(self, params: Dict) -> asyncio.Future:
+        """
+        Queue param changes.
+
+        :return: Future resolving to the Acknowledgement of the update
+                 message which carried these changes
+        """
+        self.merge(params)
+
+        acknowledged = self.loop.create_future()
+        acknowledged.add_done_callback(retrieve_exception)
+        self.waiters.append(acknowledged)
+        self.updated_event.set()
+        return acknowledged
+
+    async def wait(self) -> None:
+        """Wait until there are changes to send."""
+        await self.updated_event.wait()
+
+    def take(self) -> Tuple[Dict, List[asyncio.Future]]:
+        """
+        Take all queued changes as one batch to send, with the futures
+        waiting on them.
+        """
+        params, waiters = self.pending, self.waiters
+        self.pending, self.waiters = {}, []
+        self.in_flight = True
+        self.updated_event.clear()
+        return params, waiters
+
+    def requeue(self, params: Dict, waiters: List[asyncio.Future]) -> None:
+        """
+        Put back a batch which was not delivered, beneath any changes
+        queued since it was taken, so it is resent with them.
+        """
+        newer = self.pending
+        self.pending = {}
+        self.merge(params)
+        self.merge(newer)
+        self.waiters = waiters + self.waiters
+        self.in_flight = False
+
+        if self.pending:
+            self.updated_event.set()
+
+    def resolve(self, waiters: List[asyncio.Future], acknowledgement) -> None:
+        self.in_flight = False
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(acknowledgement)
+
+    def fail(self, waiters: List[asyncio.Future], exception) -> None:
+        self.in_flight = False
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(exception)
+
+    def cancel(self) -> None:
+        """Cancel everything waiting on queued changes."""
+        for waiter in self.waiters:
+            waiter.cancel()
+        self.pending, self.waiters = {}, []
+        self.in_flight = False
+        self.updated_event.clear()
@@ -1,69 +1,338 @@
+import asyncio
 import ipaddress
 import logging
-import socket
-import threading
-from itertools import chain
-from typing import Dict, Optional
+import time
+from typing import (AsyncIterator, Dict, Iterable, Iterator, Optional, Tuple,
+                    Union)
+
+from .cache import DiscoveryCache
+from .client import SonoffLANModeClient
+from .messages import ResponseMessage, UpdateMessage
+
+
+class ScanPlanner:
+    """
+    Plan a sweep over one or more networks without materialising their
+    addresses: hosts are generated lazily, interleaved between networks so
+    no single subnet is probed in a burst, and optionally rate limited.
+
+    Usage example:
+    planner = ScanPlanner(["10.0.0.0/16", "10.1.0.0/16"],
+                          exclude=["10.0.5.0/24"], rate=200)
+    devices = await Discover.discover(network=planner)
+    """
+
+    def __init__(self, networks: Iterable[str],
+                 exclude: Iterable[str] = (),
+                 rate: float = None) -> None:
+        """
+        Create a new ScanPlanner instance.
+
+        :param networks: CIDRs to scan, e.g. ["192.168.0.0/24"]
+        :param exclude: CIDRs or addresses to skip
+        :param rate: Maximum probes started per second in each network
+        """
+        self.networks = [ipaddress.IPv4Network(network, strict=False)
+                         for network in networks]
+        self.exclude = [ipaddress.IPv4Network(network, strict=False)
+                        for network in exclude]
+        self.rate = rate
+        self.next_probe_times = [0.0] * len(self.networks)
+
+    @staticmethod
+    def hosts(network: ipaddress.IPv4Network) -> Iterator:
+        """
+        Lazily iterate the usable hosts of a network, skipping the network
+        and broadcast addresses unless it is a /31 or /32.
+        """
+        first = int(network.network_address)
+        last = int(network.broadcast_address)
+
+        if network.prefixlen < 31:
+            first += 1
+            last -= 1
+
+        return (ipaddress.IPv4Address(address)
+                for address in range(first, last + 1))
+
+    def __iter__(self) -> Iterator:
+        remaining = [self.hosts(network) for network in self.networks]
+
+        while remaining:
+            for hosts in list(remaining):
+                for address in hosts:
+                    if not any(address in excluded
+                               for excluded in self.exclude):
+                        yield address
+                        break
+                else:
+                    remaining.remove(hosts)
+
+    async def wait(self, address) -> None:
+        """
+        Wait until a probe of the given address is allowed by the rate limit
+        of its network.
+        """
+        if self.rate is None:
+            return
+
+        address = ipaddress.IPv4Address(address)
+        for index, network in enumerate(self.networks):
+            if address in network:
+                now = time.monotonic()
+                probe_time = max(now, self.next_probe_times[index])
+                self.next_probe_times[index] = probe_time + 1 / self.rate
+                await asyncio.sleep(probe_time - now)
+                return
+
+
+Networks = Union[str, Iterable[str], ScanPlanner, None]
 
 
 class Discover:
     SONOFF_PORT = 8081
-    MAX_THREADS = 128
+    DEFAULT_CONCURRENCY = 256
+    PROBE_TIMEOUT = 0.5
+    HANDSHAKE_TIMEOUT = 2
+    DEFAULT_NETWORKS = ['127.0.0.1/32', '192.168.0.0/24', '192.168.1.0/24']
 
     @staticmethod
-    async def discover(logger=None, network: Optional[str]=None) -> Dict[str, str]:
+    async def discover(logger=None, network: Networks = None,
+                       concurrency: int = DEFAULT_CONCURRENCY,
+                       timeout: float = PROBE_TIMEOUT,
+                       confirm: bool = False,
+                       cache: DiscoveryCache = None) -> Dict[str, str]:
         """
         Attempts websocket connection on port 8081 to all IP addresses on
         common home IP subnets: 192.168.0.X and 192.168.1.X, in the hope of
         detecting  available supported devices in the local network.
 
+        Probes are non-blocking and run on the current event loop, so other
+        connections keep being serviced while the scan is in progress.
+
+        :param logger: Logger instance to output debug messages on
+        :param network: Network to scan, e.g. 192.168.0.0/24, or a list of
+                        networks or a ScanPlanner
+        :param concurrency: Maximum number of connection attempts in flight
+        :param timeout: Seconds to wait for each connection attempt
+        :param confirm: Perform the LAN mode handshake with each open host,
+                        returning only real Sonoff devices with their IDs
+        :param cache: DiscoveryCache to record confirmed devices in
         :rtype: dict
         :return: Array of devices {"ip": "device_id"}
         """
         if logger is None:
             logger = logging.getLogger(__name__)
 
-        logger.debug("Attempting connection to all IPs on local network.")
         devices = {}
 
-        networks = [ipaddress.IPv4Network(network)] if network else [
-            ipaddress.IPv4Network('127.0.0.1/32'),
-            ipaddress.IPv4Network('192.168.0.0/24'),
-            ipaddress.IPv4Network('192.168.1.0/24')
-        ]
-
         try:
-            local_ip_ranges = tuple(chain(*networks))
-
-            i = 0
-            count = len(local_ip_ranges)
-            max_threads = Discover.MAX_THREADS
-            while i < count:
-                threads = []
-                while i < count and len(threads) < max_threads:
-                    ip = local_ip_ranges[i]
-                    i += 1
-                    t = threading.Thread(target=Discover.probe_ip,
-                                         args=(logger, ip, devices))
-                    threads.append(t)
-
-                logger.debug("Starting %s threads (IPs %s of %s)",
-                             len(threads), i, count)
-                # Start all threads
-                for thread in threads:
-                    thread.start()
-
-                # Lock the main thread until all threads complete
-                for thread in threads:
-                    thread.join()
+            async for ip, device_id in Discover.iter_discover(
+                    network, logger, concurrency, timeout, confirm,
+                    cache):
+                devices[ip] = device_id or ip
 
         except Exception as ex:
-            logger.error("Caught Exception: %s" % ex, exc_info=False)
+            logger.error("Caught Exception: %s", ex, exc_info=False)
 
         return devices
 
     @staticmethod
-    def probe_ip(logger, ip, devices):
+    async def iter_discover(network: Networks = None, logger=None,
+                            concurrency: int = DEFAULT_CONCURRENCY,
+                            timeout: float = PROBE_TIMEOUT,
+                            confirm: bool = False,
+                            cache: DiscoveryCache = None
+                            ) -> AsyncIterator[Tuple[str, Optional[str]]]:
+        """
+        Scan the network like `discover`, but yield each device as soon as
+        its port answers rather than once the whole scan has finished.
+
+        Breaking out of the loop early cancels the remaining probes.
+
+        :param network: Network to scan, e.g. 192.168.0.0/24, or a list of
+                        networks or a ScanPlanner
+        :param logger: Logger instance to output debug messages on
+        :param concurrency: Maximum number of connection attempts in flight
+        :param timeout: Seconds to wait for each connection attempt
+        :param confirm: Perform the LAN mode handshake with each open host,
+                        yielding only real Sonoff devices with their IDs
+        :param cache: DiscoveryCache to record confirmed devices in
+        :return: Async iterator of (ip, device_id) tuples, where device_id
+                 is None unless the device identity has been confirmed
+        """
+        if logger is None:
+            logger = logging.getLogger(__name__)
+
+        logger.debug("Attempting connection to all IPs on local network.")
+
+        # A fixed pool of workers shares one lazy address iterator, so at
+        # most `concurrency` sockets are open at any time
+        planner = Discover.get_planner(network)
+        addresses = iter(planner)
+        hits = asyncio.Queue()
+
+        async def worker():
+            for ip in addresses:
+                await planner.wait(ip)
+                if not await Discover.probe_ip(logger, ip, timeout=timeout):
+                    continue
+
+                if not confirm:
+                    hits.put_nowait((str(ip), None))
+                    continue
+
+                device_id = await Discover.get_device_id(logger, ip)
+                if device_id is not None:
+                    if cache is not None:
+                        cache.set(device_id, str(ip))
+                    hits.put_nowait((str(ip), device_id))
+
+        workers = asyncio.gather(*(worker() for _ in range(concurrency)))
+        workers.add_done_callback(lambda _: hits.put_nowait(None))
+
+        try:
+            while True:
+                hit = await hits.get()
+                if hit is None:
+                    break
+                yield hit
+
+            # Re-raise any exception from the workers
+            await workers
+        finally:
+            workers.cancel()
+            if cache is not None:
+                cache.save()
+
+    @staticmethod
+    async def find_device(device_id: str, network: Networks = None,
+                          logger=None, cache: DiscoveryCache = None,
+                          concurrency: int = DEFAULT_CONCURRENCY,
+                          timeout: float = PROBE_TIMEOUT) -> Optional[str]:
+        """
+        Find the IP address of the device with the given device ID.
+
+        The address recorded in the cache is checked first with a single
+        handshake; the network is only scanned if the device is not cached,
+        the entry has expired or the device is no longer at that address.
+
+        :param device_id: Device ID to look for
+        :param network: Network to scan, e.g. 192.168.0.0/24, or a list of
+                        networks or a ScanPlanner
+        :param logger: Logger instance to output debug messages on
+        :param cache: DiscoveryCache to consult and update
+        :param concurrency: Maximum number of connection attempts in flight
+        :param timeout: Seconds to wait for each connection attempt
+        :return: IP address of the device, or None if it was not found
+        """
+        if logger is None:
+            logger = logging.getLogger(__name__)
+
+        if cache is not None:
+            cached_host = cache.get(device_id)
+
+            if cached_host is not None:
+                logger.debug("Checking cached address %s for device %s",
+                             cached_host, device_id)
+                current_device_id = await Discover.get_device_id(
+                    logger, cached_host)
+
+                if (current_device_id is not None
+                        and current_device_id.lower() == device_id.lower()):
+                    cache.set(device_id, cached_host)
+                    cache.save()
+                    return cached_host
+
+                cache.remove(device_id)
+
+        discovery = Discover.iter_discover(network, logger, concurrency,
+                                           timeout, True, cache)
+        try:
+            async for ip, current_device_id in discovery:
+                if current_device_id.lower() == device_id.lower():
+                    return ip
+                else:
+                    logger.info("Found device ID %s which did not match",
+                                current_device_id)
+        finally:
+            # Stop scanning the rest of the network once a match is found
+            await discovery.aclose()
+
+        return None
+
+    @staticmethod
+    async def get_device_id(logger, ip,
+                            timeout: float = HANDSHAKE_TIMEOUT
+                            ) -> Optional[str]:
+        """
+        Perform the LAN mode userOnline handshake with the host at the given
+        IP address, to confirm it is a Sonoff device and read its device ID.
+
+        :param logger: Logger instance to output debug messages on
+        :param ip: IP address of the host to identify
+        :param timeout: Seconds to wait for the handshake to complete
+        :return: Device ID, or None if the host is not a Sonoff device
+        """
+        responses = []
+
+        async def store_response(response: ResponseMessage):
+            responses.append(response)
+
+        async def store_update(update: UpdateMessage):
+            # Some devices announce their params before replying to
+            # userOnline, which is as good a confirmation
+            responses.append(update)
+
+        client = SonoffLANModeClient(
+            str(ip),
+            port=Discover.SONOFF_PORT,
+            timeout=timeout,
+            logger=logger
+        )
+        client.dispatcher.register(ResponseMessage, store_response)
+        client.dispatcher.register(UpdateMessage, store_update)
+
+        try:
+            await asyncio.wait_for(client.connect(), timeout)
+            await asyncio.wait_for(client.send_online_message(), timeout)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as ex:
+            logger.debug("Handshake with %s failed: %s", ip, ex)
+
+        finally:
+            await client.close_connection()
+
+        for response in responses:
+            if (response.device_id is not None
+                    and (isinstance(response, UpdateMessage) or response.ok)):
+                logger.debug("Found Sonoff device %s at local IP: %s",
+                             response.device_id, ip)
+                return response.device_id
+
+        return None
+
+    @staticmethod
+    def get_planner(network: Networks = None) -> ScanPlanner:
+        """
+        Get the ScanPlanner for the given network or list of networks, or
+        for the default home networks if none is given.
+        """
+        if isinstance(network, ScanPlanner):
+            return network
+
+        if isinstance(network, str):
+            return ScanPlanner([network])
+
+        return ScanPlanner(network or Discover.DEFAULT_NETWORKS)
+
+    @staticmethod
+    async def probe_ip(logger, ip, devices: Dict = None,
+                       timeout: float = PROBE_TIMEOUT,
+                       port: int = None) -> bool:
         """
         Attempt connection to IP address on specified port, adding this IP
         to the devices dict if the connection was successful
@@ -71,20 +340,23 @@ class Discover:
         :param logger: Logger instance to output debug messages on
         :param ip: IP address to test
         :param devices: Dict to insert IP into if connectable
+        :param timeout: Seconds to wait for the connection to be accepted
+        :param port: Port to connect to, SONOFF_PORT if not given
+        :return: True if the port accepted the connection
         """
-        logger.debug(
-            "Attempting connection to IP: %s on port %s" % (
-                ip, Discover.SONOFF_PORT)
-        )
-        tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        tcp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        tcp_sock.settimeout(0.5)
-        result = tcp_sock.connect_ex((str(ip), Discover.SONOFF_PORT))
-        if result == 0:
-            logger.debug(
-                "Found open port %s at local IP: %s" % (
-                    Discover.SONOFF_PORT,
-                    ip
-                )
+        port = port or Discover.SONOFF_PORT
+        logger.debug("Attempting connection to IP: %s on port %s", ip, port)
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(str(ip), port),
+                timeout
             )
-            devices[ip] = ip
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+        writer.close()
+
+        logger.debug("Found open port %s at local IP: %s", port, ip)
+        if devices is not None:
+            devices[str(ip)] = str(ip)
+        return True
@@ -0,0 +1,158 @@
+import asyncio
+import collections
+import enum
+from typing import Callable, Iterable
+
+from .changes import ParamChange
+
+
+class OverflowPolicy(enum.Enum):
+    """What an event stream does with a new event when its queue is full."""
+    # Discard the oldest queued event to make room
+    DROP_OLDEST = 'drop_oldest'
+    # Keep one queued event per param, from its first old value to its
+    # latest new value, discarding the oldest event if still full
+    COALESCE_LATEST = 'coalesce_latest'
+    # Lose no event: producers awaiting put() wait for the consumer to make
+    # room, and events pushed by the device wait in the stream's backlog
+    BLOCK = 'block'
+
+
+class EventStream:
+    """
+    Bounded queue of param changes of one device for one consumer, read
+    with `async for`. The iteration ends when the stream is closed, by the
+    consumer or when the device is stopped.
+
+    The device queues events without ever waiting, so a slow consumer
+    never delays reading messages, keepalive pings or other consumers.
+    With the drop_oldest and coalesce_latest policies a slow consumer
+    loses events of its own stream. With the block policy no event is
+    lost: events arriving while the queue is full wait in the stream's
+    backlog, which grows for as long as the consumer falls behind.
+
+    Usage example:
+    async with device.events("power", maxsize=10) as events:
+        async for change in events:
+            print(change.key, change.new)
+    """
+
+    def __init__(self,
+                 keys: Iterable[str] = (),
+                 maxsize: int = 100,
+                 overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 on_close: Callable[['EventStream'], None] = None) -> None:
+        """
+        Create a new EventStream instance.
+
+        :param keys: params to receive changes of, all params if empty
+        :param maxsize: maximum number of queued events
+        :param overflow: OverflowPolicy, or its value, to apply when full
+        :param on_close: called with the stream when it is closed
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+
+        self.keys = frozenset(keys) or None
+        self.maxsize = maxsize
+        self.overflow = OverflowPolicy(overflow)
+        self.on_close = on_close
+        self.queue = collections.deque()
+        self.backlog = collections.deque()
+        self.dropped = 0
+        self.closed = False
+        self.readable = asyncio.Event()
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+    def wants(self, change: ParamChange) -> bool:
+        return self.keys is None or change.key in self.keys
+
+    def offer(self, change: ParamChange) -> bool:
+        """
+        Queue a change without waiting.
+
+        :return: False if the change was not queued because the queue is
+                 full and the policy is to block
+        """
+        if self.closed:
+            return True
+
+        if self.overflow is OverflowPolicy.COALESCE_LATEST:
+            for index, queued in enumerate(self.queue):
+                if queued.key == change.key:
+                    del self.queue[index]
+                    self.queue.append(
+                        ParamChange(change.key, queued.old, change.new))
+                    self.dropped += 1
+                    return True
+
+        if len(self.queue) >= self.maxsize:
+            if self.overflow is OverflowPolicy.BLOCK:
+                return False
+
+            self.queue.popleft()
+            self.dropped += 1
+
+        self.queue.append(change)
+        self.readable.set()
+        if len(self.queue) >= self.maxsize:
+            self.writable.clear()
+        return True
+
+    def push(self, change: ParamChange) -> None:
+        """
+        Queue a change without waiting, keeping it in the backlog if the
+        queue is full and the policy is to block.
+        """
+        if not self.offer(change):
+            self.backlog.append(change)
+
+    async def put(self, change: ParamChange) -> None:
+        """
+        Queue a change, waiting for room if the policy is to block.
+        """
+        while not self.offer(change):
+            await self.writable.wait()
+
+    def close(self) -> None:
+        """
+        End the iteration once the queued events have been read.
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        self.readable.set()
+        self.writable.set()
+        if self.on_close is not None:
+            self.on_close(self)
+
+    def __aiter__(self) -> 'EventStream':
+        return self
+
+    async def __anext__(self) -> ParamChange:
+        while not self.queue:
+            if self.closed:
+                raise StopAsyncIteration
+
+            self.readable.clear()
+            await self.readable.wait()
+
+        change = self.queue.popleft()
+        if self.backlog:
+            self.queue.append(self.backlog.popleft())
+        else:
+            self.writable.set()
+        return change
+
+    async def __aenter__(self) -> 'EventStream':
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        self.close()
+
+    def __repr__(self):
+        return "<%s %s %i/%i+%i>" % (self.__class__.__name__,
+                                     self.overflow.value, len(self.queue),
+                                     self.maxsize, len(self.backlog))
@@ -0,0 +1,293 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+from .client import SonoffLANModeClient
+from .metrics import MetricsServer, render_prometheus
+from .reconnect import ReconnectPolicy
+from .snapshot import StateSnapshot
+from .sonoffdevice import SonoffDevice
+from .sonoffswitch import SonoffSwitch
+
+
+class SonoffFleet:
+    """
+    Many Sonoff devices driven from one shared event loop.
+
+    Each device keeps its own websocket session, but all sessions run as
+    tasks on the fleet's loop, so one process can control hundreds of
+    devices concurrently.
+
+    Usage example:
+    fleet = SonoffFleet()
+    for host in ["192.168.1.50", "192.168.1.51"]:
+        fleet.add_device(host)
+    fleet.run_until_complete(fleet.connect_all(timeout=10))
+    fleet.run_until_complete(fleet.turn_on(["100040e943"]))
+    print(fleet.state())
+    fleet.close()
+    """
+
+    def __init__(self,
+                 device_class: Callable[..., SonoffDevice] = SonoffSwitch,
+                 callback_after_update: Callable[
+                     [SonoffDevice], Awaitable[None]] = None,
+                 logger=None,
+                 loop=None,
+                 ping_interval=SonoffLANModeClient.DEFAULT_PING_INTERVAL,
+                 timeout=SonoffLANModeClient.DEFAULT_TIMEOUT,
+                 log_messages: bool = True,
+                 reconnect_policy: ReconnectPolicy = None) -> None:
+        """
+        Create a new SonoffFleet instance.
+
+        :param device_class: class used to create each device
+        :param callback_after_update: coroutine called with each device
+                                      whenever its state is updated
+        :param loop: event loop to run devices on, a new one is created
+                     and owned by the fleet if none is given
+        :param log_messages: log debug diagnostics for every message of
+                             every device; turn off for large fleets
+        :param reconnect_policy: when devices retry failed and dropped
+                                 connections, shared by all devices so its
+                                 handshake limit applies fleet-wide
+        """
+        self.device_class = device_class
+        self.callback_after_update = callback_after_update
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self.log_messages = log_messages
+        self.reconnect_policy = reconnect_policy or ReconnectPolicy()
+        self.devices = []  # type: List[SonoffDevice]
+        self.loop = loop
+        self.new_loop = False
+
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+        if self.loop is None:
+            self.new_loop = True
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+
+    def add_device(self, host: str, **kwargs) -> SonoffDevice:
+        """
+        Create a device on the fleet's loop. Its connection is started as
+        soon as the loop runs.
+
+        :param host: host name or ip address of the device
+        :param kwargs: extra arguments for the device class, e.g. port
+        """
+        kwargs.setdefault('ping_interval', self.ping_interval)
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('logger', self.logger)
+        kwargs.setdefault('log_messages', self.log_messages)
+        kwargs.setdefault('reconnect_policy', self.reconnect_policy)
+
+        device = self.device_class(
+            host=host,
+            callback_after_update=self.callback_after_update,
+            loop=self.loop,
+            **kwargs
+        )
+        self.devices.append(device)
+        return device
+
+    def get_devices(self, ids: Iterable[str] = None) -> List[SonoffDevice]:
+        """
+        Look up devices by device ID or host, or return all devices.
+        """
+        if ids is None:
+            return list(self.devices)
+
+        wanted = {str(key).lower() for key in ids}
+        return [device for device in self.devices
+                if self.device_key(device).lower() in wanted
+                or device.host.lower() in wanted]
+
+    @staticmethod
+    def device_key(device: SonoffDevice) -> str:
+        """
+        Device ID once known from the device, otherwise its host.
+        """
+        if device.basic_info is not None:
+            return device.device_id
+        return device.host
+
+    async def connect_all(self, timeout: float = None) -> Dict[str, bool]:
+        """
+        Wait until every device has completed its handshake, or until the
+        timeout has elapsed.
+
+        :return: {device_key: available} for every device
+        """
+        waiters = [asyncio.ensure_future(
+            device.client.connected_event.wait(), loop=self.loop)
+            for device in self.devices]
+
+        if waiters:
+            _, pending = await asyncio.wait(waiters, timeout=timeout)
+            for waiter in pending:
+                waiter.cancel()
+
+        return {self.device_key(device): device.available
+                for device in self.devices}
+
+    async def turn_on(self, ids: Iterable[str] = None,
+                      timeout: float = None) -> Dict:
+        """
+        Turn on the given devices (all devices if ids is None).
+
+        :param timeout: seconds to wait for each device to acknowledge,
+                        defaults to the fleet's timeout
+        :return: {device_key: result or exception} for each device, with
+                 asyncio.TimeoutError for devices which did not acknowledge
+        """
+        timeout = self.timeout if timeout is None else timeout
+        return await self.for_each(
+            ids, lambda device: device.turn_on(timeout))
+
+    async def turn_off(self, ids: Iterable[str] = None,
+                       timeout: float = None) -> Dict:
+        """
+        Turn off the given devices (all devices if ids is None).
+
+        :param timeout: seconds to wait for each device to acknowledge,
+                        defaults to the fleet's timeout
+        :return: {device_key: result or exception} for each device, with
+                 asyncio.TimeoutError for devices which did not acknowledge
+        """
+        timeout = self.timeout if timeout is None else timeout
+        return await self.for_each(
+            ids, lambda device: device.turn_off(timeout))
+
+    async def for_each(self, ids: Iterable[str],
+                       command: Callable[[SonoffDevice], Awaitable]) -> Dict:
+        devices = self.get_devices(ids)
+        results = await asyncio.gather(
+            *(command(device) for device in devices),
+            return_exceptions=True
+        )
+        return {self.device_key(device): result
+                for device, result in zip(devices, results)}
+
+    def state(self) -> Dict[str, Dict]:
+        """
+        Aggregated state of all devices, keyed by device ID or host.
+        """
+        return {
+            self.device_key(device): {
+                'host': device.host,
+                'device_id': (device.device_id
+                              if device.basic_info is not None else None),
+                'available': device.available,
+                'circuit_state': device.circuit_state,
+                'stale': device.stale,
+                'last_seen': device.last_seen,
+                'params': dict(device.params)
+            }
+            for device in self.devices
+        }
+
+    def save_snapshot(self, path: str = None) -> None:
+        """
+        Save the last known state of every device to disk, for
+        restore_snapshot to load after a restart.
+
+        :param path: snapshot file, see StateSnapshot for the default
+        """
+        StateSnapshot(path, logger=self.logger).save(
+            device.snapshot_state() for device in self.devices)
+
+    def restore_snapshot(self, path: str = None,
+                         **kwargs) -> List[SonoffDevice]:
+        """
+        Add the devices saved by save_snapshot, serving their saved state,
+        marked as stale, until they have reconnected and reported their
+        current state. Devices already in the fleet only have their state
+        restored, and only if they have not reported a state since the
+        snapshot was taken.
+
+        :param path: snapshot file, see StateSnapshot for the default
+        :param kwargs: extra arguments for the device class of added
+                       devices
+        :return: the devices whose state was restored
+        """
+        devices = []
+        for state in StateSnapshot(path, logger=self.logger).load():
+            existing = [device for device in self.devices
+                        if device.host == state['host']
+                        and state.get('port') in (None, device.port)]
+            if existing:
+                device = existing[0]
+                if (device.last_seen is not None
+                        and device.last_seen >= (state.get('last_seen')
+                                                 or 0)):
+                    continue
+            else:
+                device_kwargs = dict(kwargs)
+                if state.get('port') is not None:
+                    device_kwargs.setdefault('port', state['port'])
+                device = self.add_device(state['host'], **device_kwargs)
+
+            device.restore_state(state)
+            devices.append(device)
+
+        return devices
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        Metrics of all devices, keyed by device ID or host.
+        """
+        return {self.device_key(device): device.stats()
+                for device in self.devices}
+
+    def prometheus_text(self) -> str:
+        """
+        Metrics of all devices in the Prometheus text format, labelled by
+        device host.
+        """
+        return render_prometheus(device.metrics for device in self.devices)
+
+    async def serve_metrics(self, host: str = '127.0.0.1',
+                            port: int = 9464) -> MetricsServer:
+        """
+        Serve the metrics of all devices over HTTP for Prometheus to
+        scrape, at http://host:port/metrics.
+
+        :param host: address to listen on, local only by default
+        :param port: port to listen on, 0 picks a free port
+        :return: the started MetricsServer, stop it when no longer needed
+        """
+        server = MetricsServer(self.prometheus_text, host, port,
+                               logger=self.logger)
+        await server.start()
+        return server
+
+    async def shutdown(self) -> None:
+        """
+        Close every device connection and wait for their tasks to finish.
+        """
+        tasks = []
+        for device in self.devices:
+            tasks.extend(task for task in device.tasks
+                         if isinstance(task, asyncio.Future))
+            device.shutdown_event_loop()
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def run_until_complete(self, future):
+        return self.loop.run_until_complete(future)
+
+    def close(self) -> None:
+        """
+        Shut down all devices and, if the fleet created its loop, close it.
+        """
+        self.run_until_complete(self.shutdown())
+
+        if self.new_loop:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
@@ -0,0 +1,407 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import socket
+import struct
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+TYPE_A = 1
+TYPE_PTR = 12
+TYPE_TXT = 16
+TYPE_SRV = 33
+CLASS_IN = 1
+CLASS_CACHE_FLUSH = 0x8000
+
+MAX_NAME_POINTERS = 64
+
+
+class DNSRecord:
+    """A resource record read from an mDNS packet."""
+
+    def __init__(self, name: str, record_type: int, ttl: int, data) -> None:
+        self.name = name
+        self.type = record_type
+        self.ttl = ttl
+        self.data = data
+
+    def __repr__(self):
+        return "<%s %s type=%s ttl=%s>" % (
+            self.__class__.__name__, self.name, self.type, self.ttl)
+
+
+class MDNSDevice:
+    """An eWeLink device seen through its DNS-SD announcements."""
+
+    def __init__(self, instance: str, device_id: str) -> None:
+        self.instance = instance
+        self.device_id = device_id
+        self.host = None
+        self.port = None
+        self.txt = {}
+        self.ttl = 0
+        self.last_seen = 0.0
+
+    @property
+    def expired(self) -> bool:
+        return time.time() - self.last_seen > self.ttl
+
+    @property
+    def params(self) -> Optional[Dict]:
+        """
+        Device params published in the data1..data4 TXT keys, or None if
+        they are absent or encrypted.
+        """
+        if self.txt.get('encrypt') == 'true':
+            return None
+
+        data = ''.join(self.txt.get('data%i' % i, '') for i in range(1, 5))
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def __repr__(self):
+        return "<%s %s at %s:%s>" % (
+            self.__class__.__name__, self.device_id, self.host, self.port)
+
+
+def encode_name(name: str) -> bytes:
+    encoded = b''
+    for label in name.rstrip('.').split('.'):
+        label_bytes = label.encode('utf-8')
+        encoded += struct.pack('!B', len(label_bytes)) + label_bytes
+    return encoded + b'\x00'
+
+
+def read_name(data: bytes, offset: int) -> Tuple[str, int]:
+    """
+    Read a possibly compressed domain name, returning the name and the
+    offset of the first byte after it.
+    """
+    labels = []
+    end = None
+
+    for _ in range(MAX_NAME_POINTERS):
+        length = data[offset]
+
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+
+        offset += 1
+        if length == 0:
+            return '.'.join(labels) + '.', end or offset
+
+        labels.append(data[offset:offset + length].decode('utf-8', 'replace'))
+        offset += length
+
+    raise ValueError('Too many compression pointers in name')
+
+
+def parse_txt(rdata: bytes) -> Dict[str, str]:
+    txt = {}
+    offset = 0
+
+    while offset < len(rdata):
+        length = rdata[offset]
+        entry = rdata[offset + 1:offset + 1 + length].decode('utf-8',
+                                                             'replace')
+        offset += 1 + length
+
+        key, _, value = entry.partition('=')
+        if key:
+            txt[key.lower()] = value
+
+    return txt
+
+
+def parse_packet(data: bytes) -> List[DNSRecord]:
+    """
+    Parse the answer, authority and additional records of a DNS packet.
+    Unsupported record types are skipped.
+    """
+    _, _, questions, answers, authorities, additionals = struct.unpack_from(
+        '!HHHHHH', data)
+    offset = 12
+
+    for _ in range(questions):
+        _, offset = read_name(data, offset)
+        offset += 4
+
+    records = []
+    for _ in range(answers + authorities + additionals):
+        name, offset = read_name(data, offset)
+        record_type, _, ttl, length = struct.unpack_from('!HHIH', data,
+                                                         offset)
+        offset += 10
+        rdata_offset = offset
+        offset += length
+
+        if record_type == TYPE_PTR:
+            record_data = read_name(data, rdata_offset)[0]
+        elif record_type == TYPE_SRV:
+            _, _, port = struct.unpack_from('!HHH', data, rdata_offset)
+            record_data = (port, read_name(data, rdata_offset + 6)[0])
+        elif record_type == TYPE_TXT:
+            record_data = parse_txt(data[rdata_offset:offset])
+        elif record_type == TYPE_A:
+            if length != 4 or offset > len(data):
+                raise ValueError('Invalid A record length %i' % length)
+            record_data = socket.inet_ntoa(data[rdata_offset:offset])
+        else:
+            continue
+
+        records.append(DNSRecord(name.lower(), record_type, ttl,
+                                 record_data))
+
+    return records
+
+
+def build_query(service: str) -> bytes:
+    """Build a PTR query for the given service type."""
+    return (struct.pack('!HHHHHH', 0, 0, 1, 0, 0, 0)
+            + encode_name(service)
+            + struct.pack('!HH', TYPE_PTR, CLASS_IN))
+
+
+def build_announcement(device_id: str, host: str,
+                       port: int = 8081,
+                       txt: Dict[str, str] = None,
+                       ttl: int = 120,
+                       service: str = None) -> bytes:
+    """
+    Build the DNS-SD response an eWeLink device sends to announce itself.
+    Used by simulated devices; a TTL of 0 announces that it is leaving.
+    """
+    service = service or MDNSDiscovery.SERVICE_TYPE
+    instance = 'eWeLink_%s.%s' % (device_id, service)
+    target = 'eWeLink_%s.local.' % device_id
+
+    txt = dict({'txtvers': '1', 'id': device_id, 'apivers': '1'},
+               **(txt or {}))
+    txt_rdata = b''
+    for key, value in txt.items():
+        entry = ('%s=%s' % (key, value)).encode('utf-8')
+        txt_rdata += struct.pack('!B', len(entry)) + entry
+
+    def record(name, record_type, rdata, record_class=CLASS_IN):
+        return (encode_name(name)
+                + struct.pack('!HHIH', record_type, record_class, ttl,
+                              len(rdata))
+                + rdata)
+
+    records = [
+        record(service, TYPE_PTR, encode_name(instance)),
+        record(instance, TYPE_SRV,
+               struct.pack('!HHH', 0, 0, port) + encode_name(target),
+               CLASS_IN | CLASS_CACHE_FLUSH),
+        record(instance, TYPE_TXT, txt_rdata, CLASS_IN | CLASS_CACHE_FLUSH),
+        record(target, TYPE_A, socket.inet_aton(host),
+               CLASS_IN | CLASS_CACHE_FLUSH),
+    ]
+
+    return (struct.pack('!HHHHHH', 0, 0x8400, 0, len(records), 0, 0)
+            + b''.join(records))
+
+
+class MDNSDiscovery:
+    """
+    Passive discovery of eWeLink LAN devices from their mDNS/DNS-SD
+    (_ewelink._tcp) announcements, keeping a live registry of devices.
+
+    Usage example:
+    discovery = MDNSDiscovery()
+    await discovery.start()
+    discovery.query()
+    await asyncio.sleep(2)
+    print(discovery.devices)
+    discovery.stop()
+    """
+    SERVICE_TYPE = '_ewelink._tcp.local.'
+    MDNS_ADDRESS = '224.0.0.251'
+    MDNS_PORT = 5353
+
+    def __init__(self,
+                 callback_after_update: Callable[
+                     [MDNSDevice], Awaitable[None]] = None,
+                 address: str = MDNS_ADDRESS,
+                 port: int = MDNS_PORT,
+                 interface: str = '0.0.0.0',
+                 logger=None,
+                 loop=None) -> None:
+        """
+        Create a new MDNSDiscovery instance.
+
+        :param callback_after_update: coroutine called with each device
+                                      that is announced or updated
+        :param address: multicast group to join, or a unicast address to
+                        bind to directly (e.g. for testing on loopback)
+        :param port: UDP port to listen on
+        :param interface: address of the interface to join the group on
+        """
+        self.callback_after_update = callback_after_update
+        self.address = address
+        self.port = port
+        self.interface = interface
+        self.loop = loop
+        self.transport = None
+        self.registry = {}
+        self.hosts = {}
+
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+    @property
+    def multicast(self) -> bool:
+        return ipaddress.IPv4Address(self.address).is_multicast
+
+    async def start(self) -> None:
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                             socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        if self.multicast:
+            sock.bind(('', self.port))
+            sock.setsockopt(
+                socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                socket.inet_aton(self.address)
+                + socket.inet_aton(self.interface))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+        else:
+            sock.bind((self.address, self.port))
+            self.port = sock.getsockname()[1]
+
+        sock.setblocking(False)
+
+        self.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: MDNSProtocol(self), sock=sock)
+        self.logger.debug("Listening for mDNS announcements on %s:%s",
+                          self.address, self.port)
+
+    def stop(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def query(self, destination: Tuple[str, int] = None) -> None:
+        """
+        Ask devices to announce themselves, by sending a PTR query to the
+        multicast group or to the given (address, port).
+        """
+        if destination is None:
+            destination = (self.MDNS_ADDRESS, self.MDNS_PORT)
+
+        self.logger.debug("Sending mDNS query for %s to %s",
+                          self.SERVICE_TYPE, destination)
+        self.transport.sendto(build_query(self.SERVICE_TYPE), destination)
+
+    @property
+    def devices(self) -> Dict[str, MDNSDevice]:
+        """
+        Devices currently announced, keyed by device ID. Entries whose TTL
+        has elapsed since their last announcement are dropped.
+        """
+        for instance in [instance for instance, device
+                         in self.registry.items() if device.expired]:
+            del self.registry[instance]
+
+        return {device.device_id: device
+                for device in self.registry.values()
+                if device.host is not None}
+
+    def handle_packet(self, data: bytes, source: Tuple[str, int]) -> None:
+        try:
+            records = parse_packet(data)
+        except (ValueError, IndexError, struct.error) as ex:
+            self.logger.debug("Ignoring malformed mDNS packet from %s: %s",
+                              source[0], ex)
+            return
+
+        for record in records:
+            if record.type == TYPE_A:
+                self.hosts[record.name] = record.data
+
+        updated = []
+        for record in records:
+            if record.type == TYPE_PTR and record.name == self.SERVICE_TYPE:
+                instance = record.data.lower()
+            elif (record.type in (TYPE_SRV, TYPE_TXT)
+                  and record.name.endswith('.' + self.SERVICE_TYPE)):
+                instance = record.name
+            else:
+                continue
+
+            if record.ttl == 0:
+                self.logger.debug("Device %s left the network", instance)
+                self.registry.pop(instance, None)
+                continue
+
+            device = self.registry.get(instance)
+            if device is None:
+                label = instance[:-len(self.SERVICE_TYPE) - 1]
+                device = MDNSDevice(instance,
+                                    label.split('_', 1)[-1].lower())
+                self.registry[instance] = device
+
+            if record.type == TYPE_SRV:
+                device.port, target = record.data
+                device.host = self.hosts.get(target.lower(), source[0])
+            elif record.type == TYPE_TXT:
+                device.txt = record.data
+                if 'id' in record.data:
+                    device.device_id = record.data['id'].lower()
+
+            if device.host is None:
+                device.host = source[0]
+
+            device.ttl = record.ttl
+            device.last_seen = time.time()
+
+            if device not in updated:
+                updated.append(device)
+
+        for device in updated:
+            self.logger.debug("mDNS announcement from device %s at %s",
+                              device.device_id, device.host)
+            if self.callback_after_update is not None:
+                asyncio.ensure_future(self.callback_after_update(device),
+                                      loop=self.loop)
+
+    @staticmethod
+    async def discover(duration: float = 2, logger=None) -> Dict[str, str]:
+        """
+        Listen for announcements for the given number of seconds after
+        sending a query, and return the devices heard.
+
+        :rtype: dict
+        :return: Array of devices {"ip": "device_id"}
+        """
+        discovery = MDNSDiscovery(logger=logger)
+        await discovery.start()
+        try:
+            discovery.query()
+            await asyncio.sleep(duration)
+        finally:
+            discovery.stop()
+
+        return {device.host: device_id
+                for device_id, device in discovery.devices.items()}
+
+
+class MDNSProtocol(asyncio.DatagramProtocol):
+    def __init__(self, discovery: MDNSDiscovery) -> None:
+        self.discovery = discovery
+
+    def datagram_received(self, data, addr):
+        self.discovery.handle_packet(data, addr)
@@ -0,0 +1,118 @@
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class Message:
+    """A message received from a device, decoded once from its frame."""
+    __slots__ = ('data',)
+
+    def __init__(self, data: Dict) -> None:
+        self.data = data
+
+    @property
+    def device_id(self) -> Optional[str]:
+        return self.data.get('deviceid')
+
+    @property
+    def sequence(self) -> Optional[str]:
+        return self.data.get('sequence')
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.data)
+
+
+class ResponseMessage(Message):
+    """
+    Reply to a request, carrying its sequence and an error code, which is
+    0 on success. The reply to userOnline also carries the device ID.
+    """
+    __slots__ = ()
+
+    @property
+    def error(self) -> int:
+        return self.data['error']
+
+    @property
+    def ok(self) -> bool:
+        return self.data['error'] == 0
+
+
+class UpdateMessage(Message):
+    """
+    Params announced by the device, on connection and whenever they change.
+    """
+    __slots__ = ()
+
+    @property
+    def params(self) -> Dict:
+        return self.data.get('params', {})
+
+
+class UnknownMessage(Message):
+    """A message which is neither a reply nor a known action."""
+    __slots__ = ()
+
+
+# Message types of device initiated messages, by action
+MESSAGE_TYPES = {
+    'update': UpdateMessage,
+}
+
+
+def parse_message(data) -> Message:
+    """
+    Wrap decoded message data in the Message type matching its action, or
+    ResponseMessage for replies to requests.
+    """
+    if not isinstance(data, dict):
+        return UnknownMessage({'data': data})
+
+    action = data.get('action')
+    if action is None and 'error' in data:
+        return ResponseMessage(data)
+
+    return MESSAGE_TYPES.get(action, UnknownMessage)(data)
+
+
+class MessageDispatcher:
+    """
+    Route messages to the handler registered for their type. Messages of
+    a type with no handler go to the default handler, if there is one, and
+    are otherwise dropped.
+
+    Usage example:
+    dispatcher = MessageDispatcher()
+    dispatcher.register(UpdateMessage, handle_update)
+    await dispatcher.dispatch(parse_message(data))
+    """
+
+    def __init__(self,
+                 default_handler: Callable[
+                     [Message], Awaitable[None]] = None,
+                 logger=None) -> None:
+        self.handlers = {}
+        self.default_handler = default_handler
+
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+    def register(self, message_type: type,
+                 handler: Callable[[Message], Awaitable[None]]) -> None:
+        """
+        Handle messages of the given type, replacing any previous handler.
+        """
+        self.handlers[message_type] = handler
+
+    async def dispatch(self, message: Message) -> bool:
+        """
+        :return: True if a handler was called for the message
+        """
+        handler = self.handlers.get(type(message), self.default_handler)
+        if handler is None:
+            self.logger.debug('No handler for message: %s', message)
+            return False
+
+        await handler(message)
+        return True
@@ -0,0 +1,292 @@
+import asyncio
+import bisect
+import logging
+from typing import Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROMETHEUS_PREFIX = 'pysonofflan_'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+    """A value which only goes up, e.g. the number of messages received."""
+    type = 'counter'
+
+    def __init__(self, name: str, help_text: str = '') -> None:
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def stats(self) -> int:
+        return self.value
+
+    def samples(self) -> List[Tuple[str, Dict, float]]:
+        return [(self.name + '_total', {}, self.value)]
+
+
+class Gauge:
+    """
+    A value which goes up and down, set directly or read from a function
+    whenever it is collected.
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, help_text: str = '',
+                 function: Callable[[], float] = None) -> None:
+        self.name = name
+        self.help = help_text
+        self.function = function
+        self._value = 0
+
+    @property
+    def value(self) -> float:
+        if self.function is not None:
+            return self.function()
+        return self._value
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def stats(self) -> float:
+        return self.value
+
+    def samples(self) -> List[Tuple[str, Dict, float]]:
+        return [(self.name, {}, self.value)]
+
+
+class Histogram:
+    """
+    Distribution of observed values, e.g. round trip times, counted into
+    cumulative buckets as Prometheus expects.
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, help_text: str = '',
+                 buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help_text
+        self.buckets = sorted(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def stats(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+        }
+
+    def samples(self) -> List[Tuple[str, Dict, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            cumulative += count
+            samples.append((self.name + '_bucket', {'le': '%g' % bound},
+                            cumulative))
+
+        samples.append((self.name + '_bucket', {'le': '+Inf'}, self.count))
+        samples.append((self.name + '_sum', {}, self.sum))
+        samples.append((self.name + '_count', {}, self.count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms instrumenting one device and its
+    connection.
+
+    Usage example:
+    registry = MetricsRegistry({"host": "192.168.1.50"})
+    registry.counter("messages_received").inc()
+    registry.histogram("command_rtt_seconds").observe(0.012)
+    print(registry.stats())
+    """
+
+    def __init__(self, labels: Dict[str, str] = None) -> None:
+        """
+        Create a new MetricsRegistry instance.
+
+        :param labels: labels identifying this registry's metrics when
+                       exported alongside those of other devices
+        """
+        self.labels = dict(labels or {})
+        self.metrics = {}
+
+    def counter(self, name: str, help_text: str = '') -> Counter:
+        """Get the named counter, creating it if it does not exist yet."""
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = Counter(name, help_text)
+        return metric
+
+    def gauge(self, name: str, help_text: str = '',
+              function: Callable[[], float] = None) -> Gauge:
+        """Get the named gauge, creating it if it does not exist yet."""
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = Gauge(name, help_text, function)
+        return metric
+
+    def histogram(self, name: str, help_text: str = '',
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get the named histogram, creating it if it does not exist yet."""
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = Histogram(name, help_text, buckets)
+        return metric
+
+    def stats(self) -> Dict:
+        """
+        Current value of every metric: a number for counters and gauges,
+        and count, sum, min, max and mean for histograms.
+        """
+        return {name: metric.stats() for name, metric in self.metrics.items()}
+
+    def to_prometheus(self) -> str:
+        return render_prometheus([self])
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\')
+                     .replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in sorted(labels.items()))
+
+
+def render_prometheus(registries: Iterable[MetricsRegistry]) -> str:
+    """
+    Render the metrics of one or more registries in the Prometheus text
+    exposition format, each metric family listed once with a sample for
+    every registry, distinguished by the registry labels.
+    """
+    families = {}
+    for registry in registries:
+        for name, metric in registry.metrics.items():
+            families.setdefault(name, []).append((registry, metric))
+
+    lines = []
+    for name, members in families.items():
+        first = members[0][1]
+        family = PROMETHEUS_PREFIX + name
+        if first.type == 'counter':
+            # Counter samples are named with _total, and the text format
+            # only groups samples under metadata of the same name
+            family += '_total'
+        if first.help:
+            lines.append('# HELP %s %s' % (family, first.help))
+        lines.append('# TYPE %s %s' % (family, first.type))
+
+        for registry, metric in members:
+            for sample, labels, value in metric.samples():
+                lines.append('%s%s%s %s' % (
+                    PROMETHEUS_PREFIX, sample,
+                    format_labels(dict(registry.labels, **labels)),
+                    repr(float(value))))
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Minimal HTTP endpoint serving metrics in the Prometheus text format, on
+    the event loop of the devices it reports on.
+
+    Usage example:
+    server = MetricsServer(fleet.prometheus_text, port=9464)
+    await server.start()
+    """
+
+    def __init__(self, render: Callable[[], str],
+                 host: str = '127.0.0.1',
+                 port: int = 9464,
+                 path: str = '/metrics',
+                 logger=None) -> None:
+        """
+        Create a new MetricsServer instance.
+
+        :param render: function returning the metrics text to serve
+        :param host: address to listen on, local only by default
+        :param port: port to listen on, 0 picks a free port
+        :param path: URL path the metrics are served on
+        """
+        self.render = render
+        self.host = host
+        self.port = port
+        self.path = path
+        self.server = None
+
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+    async def start(self) -> int:
+        """
+        Start serving metrics.
+
+        :return: the port the server is listening on
+        """
+        self.server = await asyncio.start_server(self.handle_request,
+                                                 self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.logger.debug("Serving metrics on http://%s:%s%s",
+                          self.host, self.port, self.path)
+        return self.port
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle_request(self, reader, writer) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+
+            parts = request_line.decode('latin-1').split()
+            if (len(parts) >= 2 and parts[0] == 'GET'
+                    and parts[1].split('?')[0] == self.path):
+                status = '200 OK'
+                body = self.render().encode('utf-8')
+            else:
+                status = '404 Not Found'
+                body = b'Not Found\n'
+
+            writer.write(('HTTP/1.0 %s\r\n'
+                          'Content-Type: %s\r\n'
+                          'Content-Length: %i\r\n'
+                          'Connection: close\r\n\r\n'
+                          % (status, PROMETHEUS_CONTENT_TYPE, len(body))
+                          ).encode('latin-1') + body)
+            await writer.drain()
+
+        except (ConnectionError, asyncio.IncompleteReadError) as ex:
+            self.logger.debug("Metrics request failed: %s", ex)
+
+        finally:
+            writer.close()
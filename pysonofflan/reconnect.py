@@ -0,0 +1,101 @@
+import asyncio
+import random
+
+
+class HandshakeLimiter:
+    """
+    Async context manager holding one of a limited number of handshake
+    slots, or none at all when there is no limit.
+    """
+
+    def __init__(self, policy: 'ReconnectPolicy') -> None:
+        self.policy = policy
+        self.semaphore = None
+
+    async def __aenter__(self) -> None:
+        if self.policy.max_handshakes is None:
+            return
+
+        if self.policy.semaphore is None:
+            # Created on first use so it belongs to the running loop
+            self.policy.semaphore = asyncio.Semaphore(
+                self.policy.max_handshakes)
+
+        self.semaphore = self.policy.semaphore
+        await self.semaphore.acquire()
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        if self.semaphore is not None:
+            self.semaphore.release()
+            self.semaphore = None
+
+
+class ReconnectPolicy:
+    """
+    When to retry a failed or dropped connection: exponential backoff
+    capped at a maximum delay, with full jitter so that devices which lost
+    their connection together, e.g. when an access point reboots, spread
+    their reconnections out instead of retrying in lockstep.
+
+    Share one policy between devices, e.g. through SonoffFleet, to also
+    limit how many handshakes they perform at once.
+
+    Usage example:
+    policy = ReconnectPolicy(base=0.5, cap=30, max_handshakes=16)
+    fleet = SonoffFleet(reconnect_policy=policy)
+    """
+
+    def __init__(self,
+                 base: float = 0.5,
+                 factor: float = 2,
+                 cap: float = 60,
+                 jitter: bool = True,
+                 max_handshakes: int = None,
+                 seed: int = None) -> None:
+        """
+        Create a new ReconnectPolicy instance.
+
+        :param base: upper bound of the first delay, in seconds
+        :param factor: growth of the upper bound with each retry
+        :param cap: maximum delay, in seconds
+        :param jitter: pick each delay uniformly between zero and its upper
+                       bound, rather than always waiting the upper bound
+        :param max_handshakes: maximum number of connections being set up
+                               at once by devices sharing this policy, or
+                               None for no limit
+        :param seed: seed for the jitter random number generator
+        """
+        if base < 0 or cap < 0 or factor < 1:
+            raise ValueError('Backoff needs base >= 0, cap >= 0, factor >= 1')
+        if max_handshakes is not None and max_handshakes < 1:
+            raise ValueError('max_handshakes must be at least 1')
+
+        self.base = base
+        self.factor = factor
+        self.cap = cap
+        self.jitter = jitter
+        self.max_handshakes = max_handshakes
+        self.random = random.Random(seed)
+        self.semaphore = None
+
+    def delay(self, retry_count: int) -> float:
+        """
+        Seconds to wait before the given retry, counting from 0.
+        """
+        try:
+            upper = min(self.cap, self.base * self.factor ** retry_count)
+        except OverflowError:
+            upper = self.cap
+
+        if self.jitter:
+            return self.random.uniform(0, upper)
+        return upper
+
+    def handshake(self) -> HandshakeLimiter:
+        """
+        Hold a handshake slot while connecting:
+
+        async with policy.handshake():
+            await client.connect()
+        """
+        return HandshakeLimiter(self)
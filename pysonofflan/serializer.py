@@ -0,0 +1,62 @@
+import json
+from typing import Any, Callable, Dict, NamedTuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+Serializer = NamedTuple('Serializer', [
+    ('name', str),
+    ('dumps', Callable[[Any], str]),
+    ('loads', Callable[[Union[str, bytes]], Dict])
+])
+
+
+def orjson_dumps(obj) -> str:
+    # Websocket text frames need str, orjson produces bytes
+    return orjson.dumps(obj).decode('utf-8')
+
+
+def json_dumps(obj) -> str:
+    return json.dumps(obj, separators=(',', ':'))
+
+
+SERIALIZERS = {
+    'json': Serializer('json', json_dumps, json.loads),
+}
+
+if ujson is not None:
+    SERIALIZERS['ujson'] = Serializer('ujson', ujson.dumps, ujson.loads)
+
+if orjson is not None:
+    SERIALIZERS['orjson'] = Serializer('orjson', orjson_dumps, orjson.loads)
+
+# Fastest first
+PREFERENCE = ['orjson', 'ujson', 'json']
+
+
+def get_serializer(name: str = None) -> Serializer:
+    """
+    Get the JSON serializer with the given name, or the fastest one
+    installed if no name is given: orjson, then ujson, then the standard
+    library json module.
+
+    :param name: "orjson", "ujson" or "json"
+    :raises ValueError: if the named library is not installed
+    """
+    if name is None:
+        return next(SERIALIZERS[name] for name in PREFERENCE
+                    if name in SERIALIZERS)
+
+    if name not in SERIALIZERS:
+        raise ValueError('JSON library %s is not available, install it or '
+                         'choose one of: %s'
+                         % (name, ', '.join(sorted(SERIALIZERS))))
+
+    return SERIALIZERS[name]
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import random
+from typing import Dict, List
+
+import websockets
+
+from .commands import merge_params
+
+
+class SimulatedDevice:
+    """
+    Simulated Sonoff device speaking the LAN mode protocol, for testing and
+    benchmarking without hardware.
+
+    It answers the userOnline handshake, then applies and acknowledges
+    update messages, announcing its new params like a real device does.
+    Latency, dropped messages, acknowledgements and disconnects can be
+    configured to exercise error handling.
+
+    Usage example:
+    device = SimulatedDevice(device_id="100040e943")
+    port = await device.start()
+    switch = SonoffSwitch("127.0.0.1", port=port, loop=loop)
+    """
+
+    def __init__(self,
+                 device_id: str = None,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 params: Dict = None,
+                 latency: float = 0,
+                 drop_rate: float = 0,
+                 ack: bool = True,
+                 ack_error: int = 0,
+                 disconnect_after: int = None,
+                 echo_updates: bool = True,
+                 hello_first: bool = False,
+                 seed: int = None,
+                 logger=None) -> None:
+        """
+        Create a new SimulatedDevice instance.
+
+        :param device_id: device ID to report, random if not given
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free port
+        :param params: initial device params
+        :param latency: seconds to wait before each reply
+        :param drop_rate: probability of ignoring a received message
+        :param ack: whether to acknowledge update messages
+        :param ack_error: error code to acknowledge updates with, updates
+                          are only applied when this is 0
+        :param disconnect_after: close the connection instead of handling
+                                 the nth message received by the device
+        :param echo_updates: announce params after applying an update
+        :param hello_first: announce params before replying to userOnline,
+                            as some firmware does
+        :param seed: seed for the drop rate random number generator
+        """
+        self.random = random.Random(seed)
+        self.device_id = device_id or '1000%06x' % self.random.getrandbits(24)
+        self.host = host
+        self.port = port
+        self.params = params if params is not None else {'switch': 'off'}
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.ack = ack
+        self.ack_error = ack_error
+        self.disconnect_after = disconnect_after
+        self.echo_updates = echo_updates
+        self.hello_first = hello_first
+        self.server = None
+        self.connections = set()
+        self.messages_received = 0
+        self.updates_received = 0
+        self.handshakes = 0
+
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+    async def start(self) -> int:
+        """
+        Start listening for connections.
+
+        :return: the port the device is listening on
+        """
+        # Device firmware does not negotiate permessage-deflate, and its
+        # zlib contexts would dominate the memory measured per connection
+        self.server = await websockets.serve(
+            self.handler, self.host, self.port, subprotocols=['chat'],
+            compression=None)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.logger.debug("Simulated device %s listening on %s:%s",
+                          self.device_id, self.host, self.port)
+        return self.port
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def disconnect(self) -> None:
+        """Close all open connections, as when the device loses WiFi."""
+        await asyncio.gather(*(websocket.close()
+                               for websocket in list(self.connections)))
+
+    async def push_update(self, params: Dict) -> None:
+        """
+        Change params on the device side, as when its button is pressed,
+        and announce them to all connected clients.
+        """
+        self.params = merge_params(self.params, params)
+        await asyncio.gather(*(self.send_params(websocket)
+                               for websocket in list(self.connections)))
+
+    async def send_frame(self, frame: str) -> None:
+        """
+        Send a raw frame to all connected clients, e.g. a message the
+        client does not understand.
+        """
+        await asyncio.gather(*(websocket.send(frame)
+                               for websocket in list(self.connections)))
+
+    async def handler(self, websocket, path) -> None:
+        self.connections.add(websocket)
+        replies = set()
+
+        try:
+            async for message in websocket:
+                self.messages_received += 1
+
+                if self.messages_received == self.disconnect_after:
+                    await websocket.close()
+                    break
+
+                if self.random.random() < self.drop_rate:
+                    continue
+
+                # Reply from a separate task so pipelined requests each
+                # see the configured latency, rather than queueing behind it
+                reply = asyncio.ensure_future(
+                    self.reply(websocket, json.loads(message)))
+                replies.add(reply)
+                reply.add_done_callback(replies.discard)
+
+        except websockets.ConnectionClosed:
+            pass
+
+        finally:
+            self.connections.discard(websocket)
+            for reply in list(replies):
+                reply.cancel()
+
+    async def reply(self, websocket, request: Dict) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        try:
+            if request.get('action') == 'userOnline':
+                self.handshakes += 1
+                if self.hello_first:
+                    await self.send_params(websocket)
+                await self.send_response(websocket, request, 0)
+                if not self.hello_first:
+                    await self.send_params(websocket)
+
+            elif request.get('action') == 'update':
+                self.updates_received += 1
+                if not self.ack:
+                    return
+
+                await self.send_response(websocket, request, self.ack_error)
+                if self.ack_error == 0:
+                    self.params = merge_params(self.params,
+                                               request.get('params', {}))
+                    if self.echo_updates:
+                        await self.send_params(websocket)
+
+        except websockets.ConnectionClosed:
+            pass
+
+    async def send_response(self, websocket, request: Dict,
+                            error: int) -> None:
+        await websocket.send(json.dumps({
+            'error': error,
+            'apikey': 'apikey',
+            'sequence': request.get('sequence'),
+            'deviceid': self.device_id
+        }))
+
+    async def send_params(self, websocket) -> None:
+        await websocket.send(json.dumps({
+            'action': 'update',
+            'deviceid': self.device_id,
+            'apikey': 'apikey',
+            'userAgent': 'device',
+            'sequence': str(self.messages_received),
+            'params': self.params
+        }))
+
+
+async def start_devices(count: int, host: str = '127.0.0.1',
+                        **kwargs) -> List[SimulatedDevice]:
+    """
+    Start several simulated devices, each on its own port.
+
+    :param count: number of devices to start
+    :param host: address the devices listen on
+    :param kwargs: extra arguments for each SimulatedDevice
+    """
+    devices = [SimulatedDevice(device_id='1000%06x' % index, host=host,
+                               **kwargs)
+               for index in range(count)]
+    await asyncio.gather(*(device.start() for device in devices))
+    return devices
+
+
+async def stop_devices(devices: List[SimulatedDevice]) -> None:
+    await asyncio.gather(*(device.stop() for device in devices))
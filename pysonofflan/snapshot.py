@@ -0,0 +1,81 @@
+import logging
+import time
+from typing import Dict, Iterable, List
+
+from .cache import default_cache_path, write_atomic
+from .serializer import get_serializer
+
+SNAPSHOT_VERSION = 1
+
+
+class StateSnapshot:
+    """
+    On-disk snapshot of the last known state of devices: their ID, host,
+    params and when they were last heard from, so that after a restart
+    their state can be served straight away, marked as stale, while
+    connections are re-established.
+
+    Usage example:
+    snapshot = StateSnapshot()
+    snapshot.save(device.snapshot_state() for device in devices)
+    for state in snapshot.load():
+        print(state["device_id"], state["params"])
+    """
+
+    def __init__(self, path: str = None, logger=None) -> None:
+        """
+        Create a new StateSnapshot instance.
+
+        :param path: JSON file to store the snapshot in, defaults to
+                     $PYSONOFFLAN_SNAPSHOT or
+                     ~/.cache/pysonofflan/snapshot.json
+        """
+        self.path = path or self.default_path()
+        self.serializer = get_serializer()
+
+        if logger is None:
+            self.logger = logging.getLogger(__name__)
+        else:
+            self.logger = logger
+
+    @staticmethod
+    def default_path() -> str:
+        return default_cache_path('PYSONOFFLAN_SNAPSHOT', 'snapshot.json')
+
+    def load(self) -> List[Dict]:
+        """
+        Read device states from the snapshot, or none if there is no
+        usable snapshot.
+        """
+        try:
+            with open(self.path) as snapshot_file:
+                snapshot = self.serializer.loads(snapshot_file.read())
+
+            if snapshot.get('version') != SNAPSHOT_VERSION:
+                raise ValueError('unsupported version %s'
+                                 % snapshot.get('version'))
+
+            return [state for state in snapshot['devices']
+                    if state.get('host')]
+
+        except (OSError, ValueError, KeyError, AttributeError) as ex:
+            self.logger.debug("Not using state snapshot %s: %s",
+                              self.path, ex)
+            return []
+
+    def save(self, states: Iterable[Dict]) -> None:
+        """
+        Write device states to disk, replacing the previous snapshot
+        atomically.
+        """
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'saved_at': time.time(),
+            'devices': list(states),
+        }
+
+        try:
+            write_atomic(self.path, self.serializer.dumps(snapshot))
+        except OSError as ex:
+            self.logger.warning("Unable to save state snapshot %s: %s",
+                                self.path, ex)
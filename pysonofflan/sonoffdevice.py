@@ -3,17 +3,34 @@ pysonofflan
 Python library supporting Sonoff Smart Devices (Basic/S20/Touch) in LAN Mode.
 """
 import asyncio
-import json
 import logging
+import time
 from typing import Callable, Awaitable, Dict
 
 import traceback
 import websockets
 
-from .client import SonoffLANModeClient
+from .client import SonoffLANModeClient, RequestError
+from .breaker import CIRCUIT_STATE_VALUES, CircuitBreaker
+from .changes import ChangeTracker, ParamChange
+from .commands import CommandQueue, merge_params
+from .discover import Discover
+from .events import EventStream, OverflowPolicy
+from .messages import ResponseMessage, UnknownMessage, UpdateMessage
+from .metrics import MetricsRegistry
+from .reconnect import ReconnectPolicy
+from .telemetry import TelemetryBuffer
+
+try:
+    current_task = asyncio.current_task
+except AttributeError:
+    # Python 3.6
+    current_task = asyncio.Task.current_task
 
 
 class SonoffDevice(object):
+    ACKNOWLEDGE_TIMEOUT = 2
+
     def __init__(self,
                  host: str,
                  callback_after_update: Callable[..., Awaitable[None]] = None,
@@ -22,57 +39,120 @@ class SonoffDevice(object):
                  loop=None,
                  ping_interval=SonoffLANModeClient.DEFAULT_PING_INTERVAL,
                  timeout=SonoffLANModeClient.DEFAULT_TIMEOUT,
-                 context: str = None) -> None:
+                 context: str = None,
+                 port: int = SonoffLANModeClient.DEFAULT_PORT,
+                 log_messages: bool = True,
+                 reconnect_policy: ReconnectPolicy = None,
+                 circuit_breaker: CircuitBreaker = None,
+                 telemetry: TelemetryBuffer = None,
+                 autostart: bool = True) -> None:
         """
         Create a new SonoffDevice instance.
 
+        By default the connection is started straight away: on the given
+        loop, or if no loop is given, on a new loop which is run until the
+        connection ends, blocking the caller. With autostart=False nothing
+        runs until the device is started with `await device.start()` or
+        `async with device:`, so create it on the loop it will run on, or
+        pass that loop: starting it from another loop raises RuntimeError.
+
         :param str host: host name or ip address on which the device listens
         :param context: optional child ID for context in a parent device
+        :param int port: port on which the device listens (default: 8081)
+        :param log_messages: log debug diagnostics for every message; turn
+                             off to keep logging out of the message path
+                             of busy devices, even when debug is enabled
+        :param reconnect_policy: when to retry failed and dropped
+                                 connections, share one between devices to
+                                 limit their simultaneous handshakes
+        :param circuit_breaker: when to stop connecting to an unreachable
+                                device and only probe it, one per device
+        :param telemetry: buffer recording the power readings reported by
+                          the device, one per device
+        :param autostart: start connecting when created
         """
         self.callback_after_update = callback_after_update
         self.host = host
+        self.port = port
         self.context = context
+        self.reconnect_policy = reconnect_policy or ReconnectPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.telemetry = telemetry
         self.shared_state = shared_state
         self.basic_info = None
         self.params = {}
-        self.params_updated_event = None
+        # Time of the last message from the device, in seconds since the
+        # epoch, and whether params were restored from a snapshot and not
+        # yet refreshed by the device
+        self.last_seen = None
+        self.stale = False
+        self.commands = None
         self.loop = loop
         self.tasks = []                                                 # store the tasks that this module create s in a sequence
+        self.setup_connection_task = None
+        self.callback_tasks = set()
         self.new_loop = False                                           # use to decide if we should shutdown the loop on exit
-        self.messages_received = 0
+        self.metrics = MetricsRegistry({'host': host})
+        self.metrics.counter('connection_retries',
+                             'Connection attempts retried after a failure')
+        self.metrics.counter('ack_timeouts',
+                             'Update messages not acknowledged in time')
+        self.metrics.histogram('command_rtt_seconds',
+                               'Update message acknowledgement round trip '
+                               'time')
+        self.metrics.histogram('handshake_seconds',
+                               'Time to connect and complete the user online '
+                               'handshake')
+        self.metrics.counter('circuit_opened',
+                             'Times the circuit breaker opened')
+        self.metrics.counter('circuit_probes',
+                             'TCP probes of the device while unreachable')
+        self.metrics.gauge('circuit_state',
+                           'Circuit breaker state: 0 closed, 1 half-open, '
+                           '2 open',
+                           lambda: CIRCUIT_STATE_VALUES[
+                               self.circuit_breaker.state])
 
         if logger is None:
             self.logger = logging.getLogger(__name__)
         else:
             self.logger = logger
 
+        self.changes = ChangeTracker(logger=self.logger)
+
         try:
-            if self.loop is None:
+            if self.loop is None and autostart:
 
                 self.new_loop = True
                 self.loop = asyncio.new_event_loop()
                 asyncio.set_event_loop(self.loop)
 
+            elif self.loop is None:
+                self.loop = asyncio.get_event_loop()
+
             self.logger.debug(
                 'Initializing SonoffLANModeClient class in SonoffDevice')
             self.client = SonoffLANModeClient(
                 host,
-                self.handle_message,
+                port=port,
                 ping_interval=ping_interval,
                 timeout=timeout,
-                logger=self.logger
+                logger=self.logger,
+                metrics=self.metrics,
+                log_messages=log_messages
             )
 
-            self.message_ping_event = asyncio.Event()
-            self.message_acknowledged_event = asyncio.Event()
-            self.params_updated_event = asyncio.Event()
+            self.client.dispatcher.register(ResponseMessage,
+                                            self.handle_response_message)
+            self.client.dispatcher.register(UpdateMessage,
+                                            self.handle_update_message)
+            self.client.dispatcher.register(UnknownMessage,
+                                            self.handle_unknown_message)
 
-            self.tasks.append(self.loop.create_task(self.send_updated_params_loop()))
-                        
-            self.tasks.append(self.loop.create_task(self.send_availability_loop()))
-            
-            self.setup_connection_task = self.loop.create_task(self.setup_connection(not self.new_loop))
-            self.tasks.append(self.setup_connection_task)
+            self.commands = CommandQueue(self.loop)
+
+            if autostart:
+                self.create_tasks(retry=not self.new_loop)
 
             if self.new_loop:
                 self.loop.run_until_complete(self.setup_connection_task)
@@ -80,6 +160,72 @@ class SonoffDevice(object):
         except asyncio.CancelledError:
             self.logger.debug('SonoffDevice loop ended, returning')
 
+    def create_tasks(self, retry: bool) -> None:
+        self.tasks.append(
+            self.loop.create_task(self.send_updated_params_loop()))
+        self.tasks.append(
+            self.loop.create_task(self.send_availability_loop()))
+
+        self.setup_connection_task = self.loop.create_task(
+            self.setup_connection(retry))
+        self.tasks.append(self.setup_connection_task)
+
+    @property
+    def started(self) -> bool:
+        return (self.setup_connection_task is not None
+                and not self.setup_connection_task.done())
+
+    async def start(self) -> None:
+        """
+        Start connecting to the device, and keep reconnecting until stopped.
+        Returns without waiting for the connection; wait for
+        `device.client.connected_event` to know when the device is
+        available. Does nothing if the device is already started.
+
+        :raises RuntimeError: if called from a loop other than the one the
+                              device was created on
+        """
+        # The device's events and command futures belong to the loop it was
+        # created on, and would fail in obscure ways on another one
+        if asyncio.get_event_loop() is not self.loop:
+            raise RuntimeError(
+                'SonoffDevice for %s belongs to another event loop, create '
+                'it on the loop it runs on or pass that loop' % self.host)
+
+        if self.started:
+            return
+
+        self.create_tasks(retry=True)
+
+    async def stop(self) -> None:
+        """
+        Close the connection to the device, and wait until all of its tasks
+        have finished. The device can be started again afterwards.
+        """
+        # stop may be awaited from a callback, which must not cancel itself
+        current = current_task()
+        callbacks = [task for task in self.callback_tasks
+                     if task is not current]
+        tasks = [task for task in self.tasks
+                 if isinstance(task, asyncio.Future)] + callbacks
+
+        for task in self.tasks + callbacks:
+            task.cancel()
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+        self.tasks = []
+        self.changes.close_streams()
+        await self.client.close_connection()
+
+    async def __aenter__(self) -> 'SonoffDevice':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
     async def setup_connection(self, retry):
         self.logger.debug('setup_connection is active on the event loop')
                                     
@@ -87,30 +233,42 @@ class SonoffDevice(object):
     
         while True:                                                                                   
             connected = False
+
+            if retry and self.circuit_breaker.is_open:
+                await self.probe_until_reachable()
+
             try:
-                self.logger.debug('setup_connection yielding to connect()')
-                await self.client.connect()
-                self.logger.debug(
-                    'setup_connection yielding to send_online_message()')
-                await self.client.send_online_message()
+                # Bound the handshake so that an unresponsive host cannot
+                # hold a shared handshake slot for the OS connect timeout
+                async with self.reconnect_policy.handshake():
+                    await asyncio.wait_for(self.handshake(),
+                                           self.client.timeout)
 
                 connected = True
+                self.circuit_breaker.record_success()
 
+            except asyncio.TimeoutError:
+                self.logger.warning('Unable to connect: handshake timed out')
+                await self.handle_connection_failure(retry_count)
             except websockets.InvalidMessage as ex:
-                self.logger.warn('Unable to connect: %s' % ex)   
-                await self.wait_before_retry(retry_count)               
+                self.logger.warn('Unable to connect: %s', ex)
+                await self.handle_connection_failure(retry_count)
             except ConnectionRefusedError:
-                self.logger.warn('Unable to connect: connection refused')                                                                     
-                await self.wait_before_retry(retry_count)    
+                self.logger.warn('Unable to connect: connection refused')
+                await self.handle_connection_failure(retry_count)
             except websockets.exceptions.ConnectionClosed:
                 self.logger.warn('Connection closed unexpectedly during setup')
-                await self.wait_before_retry(retry_count)
+                await self.handle_connection_failure(retry_count)
             except OSError as ex:
-                self.logger.warn('OSError in setup_connection(): %s', format(ex) )
-                await self.wait_before_retry(retry_count)    
+                self.logger.warn('OSError in setup_connection(): %s', ex)
+                await self.handle_connection_failure(retry_count)
+            except asyncio.CancelledError:
+                self.logger.debug('setup_connection() cancelled')
+                await self.client.close_connection()
+                raise
             except Exception as ex:
-                self.logger.error('Unexpected error in setup_connection(): %s', format(ex) )
-                await self.wait_before_retry(retry_count)
+                self.logger.error('Unexpected error in setup_connection(): %s', ex)
+                await self.handle_connection_failure(retry_count)
 
             if connected:
                 retry_count = 0                                                                     # reset retry count after successful connection
@@ -120,24 +278,28 @@ class SonoffDevice(object):
                     await self.client.receive_message_loop()
                                                                                     
                 except websockets.InvalidMessage as ex:
-                    self.logger.warn('Unable to connect: %s' % ex)
+                    self.logger.warn('Unable to connect: %s', ex)
                 except websockets.exceptions.ConnectionClosed:
                     self.logger.warn('Connection closed in receive_message_loop()')
                 except OSError as ex:
-                    self.logger.warn('OSError in receive_message_loop(): %s', format(ex) )
+                    self.logger.warn('OSError in receive_message_loop(): %s', ex)
                 
                 except asyncio.CancelledError:
                     self.logger.debug('receive_message_loop() cancelled' )
                     break
 
                 except Exception as ex:
-                    self.logger.error('Unexpected error in receive_message_loop(): %s', format(ex) )
+                    self.logger.error('Unexpected error in receive_message_loop(): %s', ex)
                 
                 finally:
-                    self.message_ping_event.set() 
                     self.logger.debug('finally: closing websocket from setup_connection')
                     await self.client.close_connection()
 
+                # Spread out the reconnections of devices which lost their
+                # connections at the same time
+                if retry:
+                    await self.wait_before_retry(retry_count)
+
             if not retry:
                 break    
 
@@ -146,23 +308,70 @@ class SonoffDevice(object):
         self.shutdown_event_loop()
         self.logger.debug('exiting setup_connection()')
 
-    async def wait_before_retry(self, retry_count):
+    async def handshake(self):
+        start = time.monotonic()
+        self.logger.debug('setup_connection yielding to connect()')
+        await self.client.connect()
+        self.logger.debug(
+            'setup_connection yielding to send_online_message()')
+        await self.client.send_online_message()
+        self.metrics.histogram('handshake_seconds').observe(
+            time.monotonic() - start)
 
-        try:
+    async def handle_connection_failure(self, retry_count):
+        """
+        Count a failed connection attempt against the circuit breaker, then
+        wait before retrying, unless the circuit is now open and the device
+        is going to be probed instead.
+        """
+        # Release the socket of a connection which failed mid-handshake
+        if self.client.websocket is not None:
+            await self.client.close_connection()
 
-            wait_times = [0.5,1,2,5,10,30,60]                                   # increasing backoff each retry attempt
+        if self.circuit_breaker.record_failure():
+            self.metrics.counter('circuit_opened').inc()
+            self.logger.warning(
+                'Device at %s unreachable after %i attempts, probing every '
+                '%s seconds', self.host, self.circuit_breaker.failures,
+                self.circuit_breaker.probe_interval)
 
-            if retry_count >= len(wait_times):
-                retry_count = len(wait_times) -1
+        if not self.circuit_breaker.is_open:
+            await self.wait_before_retry(retry_count)
 
-            wait_time = wait_times[retry_count]
+    async def probe_until_reachable(self):
+        """
+        While the circuit is open, check the device port with a TCP probe
+        every probe interval, until it accepts a connection and the circuit
+        is half-open.
+        """
+        while self.circuit_breaker.is_open:
+            await asyncio.sleep(self.circuit_breaker.probe_interval)
+
+            self.metrics.counter('circuit_probes').inc()
+            if await Discover.probe_ip(
+                    self.logger, self.host,
+                    timeout=self.circuit_breaker.probe_timeout,
+                    port=self.port):
+                self.logger.info('Device at %s reachable again, attempting '
+                                 'to reconnect', self.host)
+                self.circuit_breaker.record_probe_success()
+
+    async def wait_before_retry(self, retry_count):
+
+        try:
 
-            self.logger.debug('Waiting %i seconds before retry', wait_time)
+            wait_time = self.reconnect_policy.delay(retry_count)               # increasing backoff each retry attempt
+            self.metrics.counter('connection_retries').inc()
+
+            self.logger.debug('Waiting %.2f seconds before retry', wait_time)
 
             await asyncio.sleep(wait_time)
 
+        except asyncio.CancelledError:
+            raise
+
         except Exception as ex:
-            self.logger.error('Unexpected error in wait_before_retry(): %s', format(ex) )
+            self.logger.error('Unexpected error in wait_before_retry(): %s', ex)
                 
     async def send_availability_loop(self):
 
@@ -171,7 +380,7 @@ class SonoffDevice(object):
                 await self.client.disconnected_event.wait()
 
                 if self.callback_after_update is not None:
-                    await self.callback_after_update(self)
+                    self.schedule_callback()
                     self.client.disconnected_event.clear()
         finally:
             self.logger.debug('exiting send_availability_loop()')
@@ -186,121 +395,282 @@ class SonoffDevice(object):
                 'Starting loop waiting for device params to change')
 
             while True:                                                     
-                self.logger.debug(
-                    'send_updated_params_loop now awaiting event')
+                if self.client.debug_messages:
+                    self.logger.debug(
+                        'send_updated_params_loop now awaiting event')
 
-                await self.params_updated_event.wait()
+                await self.commands.wait()
                 
                 await self.client.connected_event.wait()
-                self.logger.debug('Connected!')                
+                debug = self.client.debug_messages
+                if debug:
+                    self.logger.debug('Connected!')
+
+                # All changes queued so far are merged into one message,
+                # changes queued from here on go in the next message
+                params, waiters = self.commands.take()
 
                 update_message = self.client.get_update_payload(
                     self.device_id,
-                    self.params
+                    params
                 )
 
                 try:
-                    self.message_ping_event.clear()
-                    self.message_acknowledged_event.clear()
-                    await self.client.send(update_message)                    
-
-                    await asyncio.wait_for(self.message_ping_event.wait(), 2)
- 
-                    if self.message_acknowledged_event.is_set():
-                        self.params_updated_event.clear() 
-                        self.logger.debug('Update message sent, event cleared, should '
-                                    'loop now')
-                    else:
-                        self.logger.warn(
-                            "we didn't get an acknowledge message, we have probably been disconnected!")
-                                                                                # message 'ping', but not an acknowledgement, so loop
-                                                                                # if we were disconnected we will wait for reconnection
-                                                                                # if it was another type of message, we will resend change
+                    acknowledged = await self.client.send(update_message)
+
+                    acknowledgement = await asyncio.wait_for(
+                        acknowledged, self.ACKNOWLEDGE_TIMEOUT)
 
+                    if debug:
+                        self.logger.debug('Update message acknowledged, '
+                                          'should loop now')
+                    self.metrics.histogram('command_rtt_seconds').observe(
+                        acknowledgement.rtt)
+                    self.commands.resolve(waiters, acknowledgement)
+                    params = None
+
+                except RequestError as ex:
+                    self.logger.error('Update message rejected: %s', ex)
+                    self.commands.fail(waiters, ex)
+                    params = None
 
                 except websockets.exceptions.ConnectionClosed:                                   
                     self.logger.error('Connection closed unexpectedly in send()')
                 except asyncio.TimeoutError:                     
+                    self.metrics.counter('ack_timeouts').inc()
                     self.logger.warn('Update message not received, close connection, then loop')
                     await self.client.close_connection()                                        # closing connection causes cascade failure in setup_connection and reconnect
                 except OSError as ex:
-                    self.logger.warn('OSError in send(): %s', format(ex) )
+                    self.logger.warn('OSError in send(): %s', ex)
 
                 except asyncio.CancelledError:
                     self.logger.debug('send_updated_params_loop cancelled')
+
+                    for waiter in waiters:
+                        waiter.cancel()
+                    self.commands.cancel()
+                    params = None
                     break
 
                 except Exception as ex:
-                    self.logger.error('Unexpected error in send(): %s', format(ex) )
+                    self.logger.error('Unexpected error in send(): %s', ex)
+
+                finally:
+                    # The update will be resent, together with any changes
+                    # queued while it was in flight
+                    if params is not None:
+                        self.commands.requeue(params, waiters)
 
         except asyncio.CancelledError:
             self.logger.debug('send_updated_params_loop cancelled')
 
         except Exception as ex:
-            self.logger.error('Unexpected error in send(): %s', format(ex) )
+            self.logger.error('Unexpected error in send(): %s', ex)
 
         finally:
             self.logger.debug('send_updated_params_loop finally block reached')
 
-    def update_params(self, params):
-        self.logger.debug(
-            'Scheduling params update message to device: %s' % params
-        )    
-        self.params = params
-        self.params_updated_event.set()
+    def update_params(self, params) -> asyncio.Future:
+        """
+        Schedule an update message to change params on the device. Changes
+        made before the message is sent are merged into it, the latest
+        value of each param winning.
 
-    async def handle_message(self, message):
+        :return: Future resolving to the Acknowledgement of the update
+                 message which carried these params
         """
-        Receive message sent by the device and handle it, either updating
-        state or storing basic device info
+        if self.client.debug_messages:
+            self.logger.debug(
+                'Scheduling params update message to device: %s', params)
+        self.params = merge_params(self.params, params)
+        return self.commands.put(params)
+
+    async def send_params(self, params, timeout: float = None) -> float:
         """
-        
-        self.messages_received +=1                          # ensure debug messages are unique to stop deduplication by logger 
-        self.message_ping_event.set() 
+        Change params on the device, returning once it has acknowledged the
+        change. The update is retried across reconnections until then.
+
+        :param params: params to send to the device
+        :param timeout: seconds to wait for acknowledgement, or None to
+                        wait indefinitely
+        :return: round trip time of the acknowledged update, in seconds
+        :raises asyncio.TimeoutError: if not acknowledged within timeout
+        :raises RequestError: if the device rejected the update
+        """
+        acknowledgement = await asyncio.wait_for(self.update_params(params),
+                                                 timeout)
+        return acknowledgement.rtt
+
+    async def handle_response_message(self, message: ResponseMessage):
+        """
+        Store basic device info from the reply to the user online message.
+        Error replies have already been passed on to the request they
+        answer, so need no further handling.
+        """
+        if not message.ok or message.device_id is None:
+            return
 
-        response = json.loads(message)
+        self.last_seen = time.time()
 
-        if (
-            ('error' in response and response['error'] == 0)
-            and 'deviceid' in response
-        ):
+        if self.client.debug_messages:
             self.logger.debug(
-                'Message: %i: Received basic device info, storing in instance', self.messages_received)
-            self.basic_info = response
+                'Message: %i: Received basic device info, storing in '
+                'instance', self.messages_received)
+        self.basic_info = message.data
 
-            if self.client.connected_event.is_set():        # only mark message as accepted if we are already online (otherwise this is an initial connection message)
-                self.message_acknowledged_event.set()           
- 
-                if self.callback_after_update is not None:
-                    await self.callback_after_update(self)
+        if self.client.connected_event.is_set():        # only mark message as accepted if we are already online (otherwise this is an initial connection message)
+            self.schedule_callback()
 
-        elif 'action' in response and response['action'] == "update":
- 
-            self.logger.debug(
-                'Message: %i: Received update from device, updating internal state to: %s'
-                , self.messages_received , response['params']  )
+    async def handle_update_message(self, message: UpdateMessage):
+        """
+        Update state from params announced by the device.
+        """
+        send_update = False
 
-            if not self.client.connected_event.is_set():
-                self.client.connected_event.set()
-                self.client.disconnected_event.clear()
+        if self.client.debug_messages:
+            self.logger.debug(
+                'Message: %i: Received update from device, updating '
+                'internal state to: %s', self.messages_received,
+                message.params)
+
+        if not self.client.connected_event.is_set():
+            self.client.connected_event.set()
+            self.client.disconnected_event.clear()
+            send_update = True
+
+        self.last_seen = time.time()
+        changes = self.changes.update(message.params)
+
+        if self.telemetry is not None:
+            self.telemetry.record(message.params)
+
+        if not self.commands.busy:                      # only update internal state if there is not a new message queued to be sent
+            # Params restored from a snapshot are replaced, not merged
+            if self.stale:
+                params = dict(message.params)
+                self.stale = False
+            else:
+                params = merge_params(self.params, message.params)
+
+            # only send client update message if there is a change
+            if self.params != params:
+                self.params = params
                 send_update = True
 
-            if not self.params_updated_event.is_set():      # only update internal state if there is not a new message queued to be sent
-                
-                if self.params != response['params']:       # only send client update message if there is a change
-                    self.params = response['params']
-                    send_update = True
+        if changes:
+            await self.changes.notify(self, changes)
 
-            if send_update and self.callback_after_update is not None:
-                await self.callback_after_update(self)
+        if send_update:
+            self.schedule_callback()
 
-        else:
-            self.logger.error(
-                'Unknown message received from device: ' % message)
-            raise Exception('Unknown message received from device')
+    def schedule_callback(self) -> None:
+        """
+        Run callback_after_update as a task rather than in the receive
+        loop, so that the callback can await commands, whose
+        acknowledgements are read by the receive loop.
+        """
+        if self.callback_after_update is None:
+            return
+
+        task = self.loop.create_task(self.run_callback())
+        self.callback_tasks.add(task)
+        task.add_done_callback(self.callback_tasks.discard)
+
+    async def run_callback(self) -> None:
+        try:
+            await self.callback_after_update(self)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            self.logger.error('Unexpected error in callback_after_update: '
+                              '%s', ex)
+
+    async def handle_unknown_message(self, message: UnknownMessage):
+        self.logger.warning('Unknown message received from device: %s',
+                            message.data)
+
+    def subscribe(self,
+                  handler: Callable[['SonoffDevice', ParamChange],
+                                    Awaitable[None]],
+                  *keys: str) -> Callable[[], None]:
+        """
+        Be notified of changes to params reported by the device, each
+        param separately rather than the whole state at once:
+
+        async def power_changed(device, change):
+            print(change.key, change.old, change.new)
+
+        unsubscribe = device.subscribe(power_changed, "power", "current")
+
+        :param handler: coroutine called with the device and a ParamChange
+                        of (key, old, new) for every change
+        :param keys: params to be notified of, all params if none given
+        :return: function which cancels the subscription
+        """
+        return self.changes.subscribe(handler, *keys)
+
+    def events(self, *keys: str, maxsize: int = 100,
+               overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+               ) -> EventStream:
+        """
+        Stream changes to params reported by the device, each queued for
+        this consumer alone, so that reading them slowly never holds up
+        the device or other consumers:
+
+        async with device.events("switch") as events:
+            async for change in events:
+                print(change.key, change.old, change.new)
+
+        :param keys: params to stream changes of, all params if none given
+        :param maxsize: maximum number of changes queued for the consumer
+        :param overflow: OverflowPolicy, or its value, deciding what
+                         happens to new changes when the queue is full
+        :return: EventStream, which ends when closed or the device stops
+        """
+        stream = EventStream(keys, maxsize=maxsize, overflow=overflow,
+                             on_close=self.changes.remove_stream)
+        self.changes.add_stream(stream)
+        return stream
+
+    def snapshot_state(self) -> Dict:
+        """
+        Last known state of the device, to be restored with restore_state
+        after a restart.
+        """
+        return {
+            'device_id': (self.device_id
+                          if self.basic_info is not None else None),
+            'host': self.host,
+            'port': self.port,
+            'params': dict(self.params),
+            'last_seen': self.last_seen,
+        }
+
+    def restore_state(self, state: Dict) -> None:
+        """
+        Serve state saved by snapshot_state until the device reports its
+        current state. Until then the device is marked as stale.
+        """
+        if self.basic_info is None and state.get('device_id'):
+            self.basic_info = {'deviceid': state['device_id']}
+
+        self.params = dict(state.get('params') or {})
+        self.changes.params = dict(self.params)
+        self.last_seen = state.get('last_seen')
+        self.stale = True
+
+    def stats(self) -> Dict:
+        """
+        Current metrics of this device and its connection.
+
+        :return: {metric name: value} for counters, and {metric name:
+                 {"count", "sum", "min", "max", "mean"}} for histograms
+        """
+        return self.metrics.stats()
 
     def shutdown_event_loop(self):
         self.logger.debug('shutdown_event_loop called')
+        self.changes.close_streams()
 
         try:
             # Hide Cancelled Error exceptions during shutdown
@@ -337,7 +707,7 @@ class SonoffDevice(object):
                     self.loop.run_forever()
         
         except Exception as ex:
-                self.logger.error('Unexpected error in shutdown_event_loop(): %s', format(ex) )
+                self.logger.error('Unexpected error in shutdown_event_loop(): %s', ex)
 
         finally:
             if self.new_loop:
@@ -353,6 +723,23 @@ class SonoffDevice(object):
                     self.loop.close()
             
 
+    @property
+    def circuit_state(self) -> str:
+        """
+        Circuit breaker state of the connection to the device.
+
+        :return: "closed", "half_open" or "open"
+        """
+        return self.circuit_breaker.state.value
+
+    @property
+    def messages_received(self) -> int:
+        """
+        Number of messages received from the device, which also makes debug
+        messages unique to stop deduplication by the logger.
+        """
+        return self.metrics.counter('messages_received').value
+
     @property
     def device_id(self) -> str:
         """
@@ -363,7 +750,7 @@ class SonoffDevice(object):
         """
         return self.basic_info['deviceid']
 
-    async def turn_off(self) -> None:
+    async def turn_off(self, timeout: float = None) -> float:
         """
         Turns the device off.
         """
@@ -379,7 +766,7 @@ class SonoffDevice(object):
         """
         return not self.is_on
 
-    async def turn_on(self) -> None:
+    async def turn_on(self, timeout: float = None) -> float:
         """
         Turns the device on.
         """
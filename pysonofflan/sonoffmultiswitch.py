@@ -0,0 +1,165 @@
+import logging
+from typing import Awaitable, Callable, Dict, List, Union
+
+from pysonofflan import SonoffDevice, SonoffSwitch
+
+
+class SonoffChannel:
+    """
+    One outlet of a multi-channel device, reading its state from and
+    sending its changes through the device it belongs to.
+    """
+    __slots__ = ('device', 'outlet')
+
+    def __init__(self, device: 'SonoffMultiSwitch', outlet: int) -> None:
+        self.device = device
+        self.outlet = outlet
+
+    @property
+    def state(self) -> str:
+        """
+        Retrieve the channel state
+
+        :returns: one of
+                  SWITCH_STATE_ON
+                  SWITCH_STATE_OFF
+                  SWITCH_STATE_UNKNOWN
+        :rtype: str
+        """
+        for entry in self.device.params.get('switches', []):
+            if entry.get('outlet') == self.outlet:
+                state = entry.get('switch')
+                if state == 'on':
+                    return SonoffSwitch.SWITCH_STATE_ON
+                elif state == 'off':
+                    return SonoffSwitch.SWITCH_STATE_OFF
+
+        return SonoffSwitch.SWITCH_STATE_UNKNOWN
+
+    @property
+    def is_on(self) -> bool:
+        return self.state == SonoffSwitch.SWITCH_STATE_ON
+
+    async def turn_on(self, timeout: float = None) -> float:
+        return await self.device.set_channels({self.outlet: True}, timeout)
+
+    async def turn_off(self, timeout: float = None) -> float:
+        return await self.device.set_channels({self.outlet: False}, timeout)
+
+    def __repr__(self):
+        return "<%s %i of %r>" % (
+            self.__class__.__name__, self.outlet, self.device)
+
+
+class SonoffMultiSwitch(SonoffDevice):
+    """Representation of a multi-channel Sonoff device in LAN Mode, e.g. a
+    Sonoff 4CH, Dual or T1 2C, which reports one switch state per outlet.
+
+    Changes to several channels are sent in a single update message, so a
+    scene change takes one round trip however many channels it touches.
+
+    Usage example when used as library:
+    p = SonoffMultiSwitch("192.168.1.106", autostart=False)
+    # turn outlets 0 and 2 on and outlet 1 off, in one update
+    await p.set_channels({0: True, 1: False, 2: "on"})
+    # query and print the state of each outlet
+    for channel in p.channels:
+        print(channel.outlet, channel.state)
+    """
+
+    def __init__(self,
+                 host: str,
+                 callback_after_update: Callable[
+                     [SonoffDevice], Awaitable[None]] = None,
+                 logger=None,
+                 **kwargs) -> None:
+        """
+        Create a new SonoffMultiSwitch instance, taking the same arguments
+        as SonoffDevice.
+        """
+        self._channels = {}
+
+        if logger is None:
+            logger = logging.getLogger(__name__)
+
+        SonoffDevice.__init__(
+            self,
+            host=host,
+            callback_after_update=callback_after_update,
+            logger=logger,
+            **kwargs
+        )
+
+    @property
+    def channels(self) -> List[SonoffChannel]:
+        """
+        The channels reported by the device, ordered by outlet number.
+        """
+        return [self.channel(entry['outlet'])
+                for entry in self.params.get('switches', [])
+                if 'outlet' in entry]
+
+    def channel(self, outlet: int) -> SonoffChannel:
+        """
+        Get the channel for an outlet number, counting from 0.
+        """
+        channel = self._channels.get(outlet)
+        if channel is None:
+            channel = self._channels[outlet] = SonoffChannel(self, outlet)
+        return channel
+
+    async def set_channels(self, states: Dict[int, Union[bool, str]],
+                           timeout: float = None) -> float:
+        """
+        Switch several channels in one update message, returning once the
+        device has acknowledged.
+
+        :param states: new state for each outlet number, True or "on" to
+                       turn it on, False or "off" to turn it off
+        :param timeout: seconds to wait for acknowledgement, or None to
+                        wait indefinitely
+        :return: round trip time of the update, in seconds
+        :raises ValueError: on invalid state, or if no states are given
+        """
+        if not states:
+            raise ValueError("No channels to switch.")
+
+        switches = []
+        for outlet, state in sorted(states.items()):
+            if isinstance(state, str) and state.lower() in ('on', 'off'):
+                state = state.lower()
+            elif isinstance(state, bool):
+                state = 'on' if state else 'off'
+            else:
+                raise ValueError("State %s is not valid." % state)
+
+            switches.append({'outlet': outlet, 'switch': state})
+
+        self.logger.debug("Setting channels: %s", switches)
+        return await self.send_params({'switches': switches}, timeout)
+
+    @property
+    def is_on(self) -> bool:
+        """
+        Returns whether any channel is on.
+        :return: True if any channel is on, False otherwise
+        """
+        return any(channel.is_on for channel in self.channels)
+
+    async def turn_on(self, timeout: float = None) -> float:
+        """
+        Turn every channel on in one update message.
+
+        :raises ValueError: if the device has not reported its channels yet
+        """
+        return await self.set_channels(
+            {channel.outlet: True for channel in self.channels}, timeout)
+
+    async def turn_off(self, timeout: float = None) -> float:
+        """
+        Turn every channel off in one update message.
+
+        :raises ValueError: if the device has not reported its channels yet
+        """
+        return await self.set_channels(
+            {channel.outlet: False for channel in self.channels}, timeout)
@@ -3,6 +3,9 @@ import logging
 from typing import Callable, Awaitable, Dict
 
 from pysonofflan import SonoffDevice, SonoffLANModeClient
+from .breaker import CircuitBreaker
+from .reconnect import ReconnectPolicy
+from .telemetry import TelemetryBuffer
 
 
 class SonoffSwitch(SonoffDevice):
@@ -36,7 +39,13 @@ class SonoffSwitch(SonoffDevice):
                  loop=None,
                  ping_interval=SonoffLANModeClient.DEFAULT_PING_INTERVAL,
                  timeout=SonoffLANModeClient.DEFAULT_TIMEOUT,
-                 context: str = None) -> None:
+                 context: str = None,
+                 port: int = SonoffLANModeClient.DEFAULT_PORT,
+                 log_messages: bool = True,
+                 reconnect_policy: ReconnectPolicy = None,
+                 circuit_breaker: CircuitBreaker = None,
+                 telemetry: TelemetryBuffer = None,
+                 autostart: bool = True) -> None:
 
         self.inching_seconds = inching_seconds
         self.parent_callback_after_update = callback_after_update
@@ -55,7 +64,13 @@ class SonoffSwitch(SonoffDevice):
             shared_state=shared_state,
             ping_interval=ping_interval,
             timeout=timeout,
-            context=context
+            context=context,
+            port=port,
+            log_messages=log_messages,
+            reconnect_policy=reconnect_policy,
+            circuit_breaker=circuit_breaker,
+            telemetry=telemetry,
+            autostart=autostart
         )
 
     @property
@@ -113,19 +128,27 @@ class SonoffSwitch(SonoffDevice):
 
         return False
 
-    async def turn_on(self):
+    async def turn_on(self, timeout: float = None) -> float:
         """
-        Turn the switch on.
+        Turn the switch on, returning once the device has acknowledged.
+
+        :param timeout: seconds to wait for acknowledgement, or None to
+                        wait indefinitely
+        :return: round trip time of the update, in seconds
         """
         self.logger.debug("Switch turn_on called.")
-        self.update_params({"switch": "on"})
+        return await self.send_params({"switch": "on"}, timeout)
 
-    async def turn_off(self):
+    async def turn_off(self, timeout: float = None) -> float:
         """
-        Turn the switch off.
+        Turn the switch off, returning once the device has acknowledged.
+
+        :param timeout: seconds to wait for acknowledgement, or None to
+                        wait indefinitely
+        :return: round trip time of the update, in seconds
         """
         self.logger.debug("Switch turn_off called.")
-        self.update_params({"switch": "off"})
+        return await self.send_params({"switch": "off"}, timeout)
 
     async def shutdown_inching(self):
         self.logger.debug("shutdown_inching running")
@@ -145,7 +168,9 @@ class SonoffSwitch(SonoffDevice):
         Handle update callback to implement inching functionality before
         calling the parent callback
         """
-        self.logger.debug("Switch update pre-callback filter running")
+        debug = self.client.debug_messages
+        if debug:
+            self.logger.debug("Switch update pre-callback filter running")
 
         if self.basic_info is None:
             self.logger.debug(
@@ -153,12 +178,13 @@ class SonoffSwitch(SonoffDevice):
             return
 
         if self.inching_seconds is not None:
-            self.logger.debug("Inching switch pre-callback logic running")
+            if debug:
+                self.logger.debug("Inching switch pre-callback logic running")
 
             if self.is_off:
                 self.logger.debug(
                     "Inching switch activated, waiting %ss before "
-                    "turning OFF again" % self.inching_seconds)
+                    "turning OFF again", self.inching_seconds)
 
                 inching_task = self.loop.call_later(
                     self.inching_seconds,
@@ -166,9 +192,11 @@ class SonoffSwitch(SonoffDevice):
                 )
 
                 self.tasks.append(inching_task)        
-                await self.turn_on()
+                self.update_params({"switch": "on"})
         else:
-            self.logger.debug("Not inching switch, calling parent callback")
+            if debug:
+                self.logger.debug(
+                    "Not inching switch, calling parent callback")
 
             if self.parent_callback_after_update is not None:
                 await self.parent_callback_after_update(self)
@@ -0,0 +1,203 @@
+import array
+import math
+import time
+from typing import Dict, Iterable, List
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Readings pushed by power monitoring devices, e.g. Sonoff POW and S31
+TELEMETRY_FIELDS = ('power', 'voltage', 'current')
+
+
+class TelemetryBuffer:
+    """
+    Ring buffer of the latest power readings of one device, stored as
+    flat arrays of doubles rather than dicts, so hundreds of devices can
+    keep a history in one process. Once full, the oldest readings are
+    overwritten.
+
+    Readings missing from an update are stored as NaN and left out of
+    downsampled values.
+
+    Usage example:
+    telemetry = TelemetryBuffer(capacity=3600)
+    plug = SonoffSwitch("192.168.1.52", telemetry=telemetry)
+    print(telemetry.downsample(60))
+    print(telemetry.energy())
+    """
+
+    def __init__(self,
+                 capacity: int = 1024,
+                 fields: Iterable[str] = TELEMETRY_FIELDS) -> None:
+        """
+        Create a new TelemetryBuffer instance.
+
+        :param capacity: number of readings kept
+        :param fields: params recorded with each reading
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.timestamps = array.array('d', bytes(8 * capacity))
+        self.columns = {field: array.array('d', [math.nan]) * capacity
+                        for field in self.fields}
+        self.next = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def record(self, params: Dict, timestamp: float = None) -> bool:
+        """
+        Store the readings found in device params, which report them as
+        strings or numbers.
+
+        :param timestamp: time of the reading, in seconds since the epoch,
+                          the current time if not given
+        :return: False if the params held no readings, which are not stored
+        """
+        values = {}
+        for field in self.fields:
+            try:
+                values[field] = float(params[field])
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        if not values:
+            return False
+
+        index = self.next
+        self.timestamps[index] = (time.time() if timestamp is None
+                                  else timestamp)
+        for field, column in self.columns.items():
+            column[index] = values.get(field, math.nan)
+
+        self.next = (index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return True
+
+    def ordered(self, column: array.array) -> array.array:
+        """Copy of a column, oldest reading first."""
+        start = (self.next - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return column[start:start + self.count]
+        return column[start:] + column[:self.next]
+
+    def values(self, field: str) -> array.array:
+        """
+        Recorded values of one field, oldest first.
+
+        :raises KeyError: if the field is not recorded
+        """
+        return self.ordered(self.columns[field])
+
+    def times(self) -> array.array:
+        """Recorded timestamps, oldest first."""
+        return self.ordered(self.timestamps)
+
+    def downsample(self, interval: float) -> List[Dict]:
+        """
+        Summarise readings over consecutive periods, aligned to multiples
+        of the interval.
+
+        :param interval: length of each period, in seconds
+        :return: for each period with readings, oldest first,
+                 {"start": timestamp, "count": readings,
+                  field: {"min", "max", "avg"} or None}
+        """
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+
+        times = self.times()
+        columns = [(field, self.values(field)) for field in self.fields]
+        periods = []
+        start = None
+        first = 0
+
+        for index in range(len(times) + 1):
+            period = (None if index == len(times)
+                      else math.floor(times[index] / interval) * interval)
+            if period == start:
+                continue
+
+            if start is not None:
+                summary = {'start': start, 'count': index - first}
+                for field, values in columns:
+                    summary[field] = summarise(values[first:index])
+                periods.append(summary)
+
+            start = period
+            first = index
+
+        return periods
+
+    def energy(self, field: str = 'power') -> float:
+        """
+        Energy used over the recorded period, integrating power readings in
+        watts over time.
+
+        :return: energy in watt hours
+        """
+        times = self.times()
+        values = self.values(field)
+        total = 0.0
+        previous = None
+
+        for timestamp, value in zip(times, values):
+            if math.isnan(value):
+                continue
+            if previous is not None:
+                total += (timestamp - previous[0]) * (value + previous[1]) / 2
+            previous = (timestamp, value)
+
+        return total / 3600
+
+    def export(self) -> Dict[str, List[float]]:
+        """
+        Recorded readings as lists, oldest first, keyed by "timestamp" and
+        field name, e.g. to serialise as JSON.
+        """
+        exported = {'timestamp': self.times().tolist()}
+        for field in self.fields:
+            exported[field] = self.values(field).tolist()
+        return exported
+
+    def to_numpy(self) -> Dict:
+        """
+        Recorded readings as NumPy arrays, oldest first, keyed by
+        "timestamp" and field name.
+
+        :raises RuntimeError: if NumPy is not installed
+        """
+        if numpy is None:
+            raise RuntimeError('NumPy is not installed')
+
+        exported = {'timestamp': numpy.frombuffer(self.times())}
+        for field in self.fields:
+            exported[field] = numpy.frombuffer(self.values(field))
+        return exported
+
+    def __repr__(self):
+        return "<%s %i/%i>" % (self.__class__.__name__, self.count,
+                               self.capacity)
+
+
+def summarise(values: Iterable[float]) -> Dict:
+    """
+    Minimum, maximum and mean of values, ignoring NaN, or None if there
+    are no values.
+    """
+    values = [value for value in values if not math.isnan(value)]
+    if not values:
+        return None
+
+    return {
+        'min': min(values),
+        'max': max(values),
+        'avg': sum(values) / len(values),
+    }
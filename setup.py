@@ -12,6 +12,12 @@ with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
 requirements = ['Click>=7.0', 'click_log', 'websockets']
+extras_requirements = {
+    # Faster JSON encoding and decoding, used automatically when installed
+    'fast': ['orjson'],
+    # Export of recorded power readings as NumPy arrays
+    'numpy': ['numpy'],
+}
 setup_requirements = []
 test_requirements = ['pytest', 'tox', 'python-coveralls']
 
@@ -23,7 +29,6 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Natural Language :: English',
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
     ],
@@ -35,7 +40,9 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
+    python_requires='>=3.6',
     long_description=readme + '\n\n' + history,
     include_package_data=True,
     keywords='pysonofflan',
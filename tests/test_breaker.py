@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.breaker` module."""
+
+import unittest
+
+from pysonofflan import CircuitBreaker
+from pysonofflan.breaker import CircuitState
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Tests for circuit breaker state transitions."""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=3)
+
+    def test_opens_after_consecutive_failures(self):
+        assert not self.breaker.record_failure()
+        assert not self.breaker.record_failure()
+        assert self.breaker.record_failure()
+
+        assert self.breaker.state is CircuitState.OPEN
+        assert not self.breaker.record_failure()
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+
+        assert self.breaker.state is CircuitState.CLOSED
+        assert self.breaker.failures == 1
+
+    def test_half_open_after_probe(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.breaker.record_probe_success()
+
+        assert self.breaker.state is CircuitState.HALF_OPEN
+
+        # A single failed handshake opens the circuit again
+        assert self.breaker.record_failure()
+        assert self.breaker.is_open
+
+        self.breaker.record_probe_success()
+        self.breaker.record_success()
+        assert self.breaker.state is CircuitState.CLOSED
+
+    def test_probe_success_while_closed(self):
+        self.breaker.record_probe_success()
+
+        assert self.breaker.state is CircuitState.CLOSED
+
+    def test_invalid_threshold(self):
+        with self.assertRaises(ValueError):
+            CircuitBreaker(failure_threshold=0)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.cache` module."""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from pysonofflan import DiscoveryCache
+
+
+class TestDiscoveryCache(unittest.TestCase):
+    """Tests for the on-disk discovery cache."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sub', 'devices.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_missing_file_is_empty(self):
+        cache = DiscoveryCache(self.path)
+        assert cache.get('100040e943') is None
+
+    def test_round_trip(self):
+        cache = DiscoveryCache(self.path)
+        cache.set('100040E943', '192.168.0.77')
+        cache.save()
+
+        assert DiscoveryCache(self.path).get('100040e943') == '192.168.0.77'
+
+    def test_invalid_file_is_empty(self):
+        os.makedirs(os.path.dirname(self.path))
+        for content in ['["192.168.0.77"]', 'not json']:
+            with open(self.path, 'w') as cache_file:
+                cache_file.write(content)
+
+            assert DiscoveryCache(self.path).get('100040e943') is None
+
+    def test_invalid_entry_is_ignored(self):
+        cache = DiscoveryCache(self.path)
+        for entry in [{'host': '192.168.0.77'}, {'last_seen': time.time()},
+                      '192.168.0.77', {'host': '192.168.0.77',
+                                       'last_seen': 'yesterday'}]:
+            cache.load()['100040e943'] = entry
+
+            assert cache.get('100040e943') is None
+
+    def test_expired_entry(self):
+        cache = DiscoveryCache(self.path, ttl=60)
+        cache.set('100040e943', '192.168.0.77')
+
+        with mock.patch('time.time', return_value=time.time() + 61):
+            assert cache.get('100040e943') is None
+
+    def test_default_path_from_environment(self):
+        with mock.patch.dict(os.environ, {'PYSONOFFLAN_CACHE': self.path}):
+            assert DiscoveryCache().path == self.path
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.changes` module."""
+
+import asyncio
+import unittest
+
+from pysonofflan.changes import ChangeTracker, ParamChange, diff_params
+
+
+class TestChanges(unittest.TestCase):
+    """Tests for per-param change notifications."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.tracker = ChangeTracker()
+        self.received = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    async def handler(self, device, change):
+        self.received.append((device, change))
+
+    def test_diff_params(self):
+        changes = diff_params({'switch': 'off', 'power': '1.0'},
+                              {'switch': 'on', 'power': '1.0', 'current': 0})
+
+        assert changes == [ParamChange('switch', 'off', 'on'),
+                           ParamChange('current', None, 0)]
+
+    def test_partial_updates_are_merged(self):
+        self.tracker.update({'switch': 'on', 'power': '1.0'})
+
+        changes = self.tracker.update({'power': '2.5'})
+
+        assert changes == [('power', '1.0', '2.5')]
+        assert self.tracker.params == {'switch': 'on', 'power': '2.5'}
+        assert self.tracker.update({'power': '2.5'}) == []
+
+    def test_channel_changes_carry_all_channels(self):
+        self.tracker.update({'switches': [{'outlet': 0, 'switch': 'off'},
+                                          {'outlet': 1, 'switch': 'off'}]})
+
+        changes = self.tracker.update(
+            {'switches': [{'outlet': 1, 'switch': 'on'}]})
+
+        assert changes[0].new == [{'outlet': 0, 'switch': 'off'},
+                                  {'outlet': 1, 'switch': 'on'}]
+        assert self.tracker.update(
+            {'switches': [{'outlet': 1, 'switch': 'on'}]}) == []
+
+    def test_subscribers_get_their_keys(self):
+        self.tracker.subscribe(self.handler, 'power', 'current')
+        unsubscribe = self.tracker.subscribe(self.handler)
+
+        changes = self.tracker.update({'switch': 'on', 'power': '1.0'})
+        self.loop.run_until_complete(self.tracker.notify('device', changes))
+
+        assert self.received == [
+            ('device', ('power', None, '1.0')),
+            ('device', ('switch', None, 'on')),
+            ('device', ('power', None, '1.0')),
+        ]
+
+        unsubscribe()
+        unsubscribe()
+        self.received.clear()
+        changes = self.tracker.update({'switch': 'off'})
+        self.loop.run_until_complete(self.tracker.notify('device', changes))
+
+        assert self.received == []
+
+    def test_failing_subscriber_does_not_stop_others(self):
+        async def failing(device, change):
+            raise ValueError('subscriber bug')
+
+        self.tracker.subscribe(failing)
+        self.tracker.subscribe(self.handler)
+
+        changes = self.tracker.update({'switch': 'on'})
+        with self.assertLogs('pysonofflan.changes', 'ERROR'):
+            self.loop.run_until_complete(
+                self.tracker.notify('device', changes))
+
+        assert len(self.received) == 1
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.client` module."""
+
+import asyncio
+import json
+import unittest
+
+import websockets
+
+from pysonofflan import SonoffLANModeClient
+from pysonofflan.client import RequestError
+
+
+class TestSonoffLANModeClient(unittest.TestCase):
+    """Tests for request/response correlation by sequence number."""
+
+    def setUp(self):
+        """Start a device which acknowledges batches in reverse order."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        async def reverse_acks(websocket, path):
+            requests = [json.loads(await websocket.recv()) for _ in range(3)]
+            for request in reversed(requests):
+                await websocket.send(json.dumps({
+                    'error': request['params'].get('error', 0),
+                    'sequence': request['sequence'],
+                    'deviceid': '100040e943'
+                }))
+            await websocket.wait_closed()
+
+        self.server = self.loop.run_until_complete(websockets.serve(
+            reverse_acks, '127.0.0.1', 0, subprotocols=['chat']))
+
+        self.client = SonoffLANModeClient(
+            '127.0.0.1',
+            port=self.server.sockets[0].getsockname()[1])
+        self.loop.run_until_complete(self.client.connect())
+        self.receiver = self.loop.create_task(
+            self.client.receive_message_loop())
+
+    def tearDown(self):
+        self.receiver.cancel()
+        self.loop.run_until_complete(self.client.close_connection())
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    def send_all(self, params_list):
+        async def send_all():
+            acknowledged = [
+                await self.client.send(self.client.get_update_payload(
+                    '100040e943', params))
+                for params in params_list
+            ]
+            return await asyncio.gather(*acknowledged,
+                                        return_exceptions=True)
+
+        return self.loop.run_until_complete(send_all())
+
+    def test_pipelined_requests_resolve_by_sequence(self):
+        results = self.send_all([{'switch': 'on'}] * 3)
+        sequences = [ack.sequence for ack in results]
+
+        assert len(set(sequences)) == 3
+        assert sequences == sorted(sequences)
+        assert all(ack.response['sequence'] == ack.sequence
+                   for ack in results)
+        assert all(ack.rtt >= 0 for ack in results)
+        assert self.client.pending_requests == {}
+
+    def test_error_reply_raises(self):
+        results = self.send_all([{}, {'error': 400}, {}])
+
+        assert isinstance(results[1], RequestError)
+        assert results[1].error == 400
+        assert results[0].response['error'] == 0
+
+    def test_close_fails_pending_requests(self):
+        async def send_then_close():
+            acknowledged = await self.client.send(
+                self.client.get_update_payload('100040e943', {}))
+            await self.client.close_connection()
+            return await asyncio.gather(acknowledged, return_exceptions=True)
+
+        result, = self.loop.run_until_complete(send_then_close())
+        assert isinstance(result, websockets.ConnectionClosed)
+
+
+class MismatchedPongProtocol(websockets.WebSocketServerProtocol):
+    """Answers pings with a pong of its own payload, as devices do."""
+
+    async def pong(self, data=b''):
+        await super().pong(b'sonoff')
+
+
+class SilentProtocol(websockets.WebSocketServerProtocol):
+    """Never answers pings."""
+
+    async def pong(self, data=b''):
+        pass
+
+
+class TestKeepalive(unittest.TestCase):
+    """Tests for keepalive pings sent by the client."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = None
+        self.client = None
+
+    def tearDown(self):
+        if self.client is not None:
+            self.loop.run_until_complete(self.client.close_connection())
+        if self.server is not None:
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    def connect(self, protocol):
+        async def idle(websocket, path):
+            await websocket.wait_closed()
+
+        self.server = self.loop.run_until_complete(websockets.serve(
+            idle, '127.0.0.1', 0, subprotocols=['chat'], klass=protocol))
+
+        self.client = SonoffLANModeClient(
+            '127.0.0.1', port=self.server.sockets[0].getsockname()[1],
+            ping_interval=0.05, timeout=0.5)
+        self.loop.run_until_complete(self.client.connect())
+
+    def test_pong_with_other_payload_acknowledges_ping(self):
+        self.connect(MismatchedPongProtocol)
+        self.loop.run_until_complete(asyncio.sleep(0.3))
+
+        assert self.client.metrics.histogram('ping_rtt_seconds').count >= 2
+        assert self.client.websocket.open
+
+    def test_connection_fails_without_pongs(self):
+        self.connect(SilentProtocol)
+
+        self.loop.run_until_complete(asyncio.wait_for(
+            self.client.websocket.wait_closed(), 3))
+
+        assert self.client.metrics.histogram('ping_rtt_seconds').count == 0
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.commands` module."""
+
+import asyncio
+import gc
+import unittest
+
+from pysonofflan.commands import CommandQueue, merge_params
+
+
+class TestCommandQueue(unittest.TestCase):
+    """Tests for coalescing param changes into update messages."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.commands = CommandQueue(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_burst_is_merged_last_write_wins(self):
+        first = self.commands.put({'switch': 'on'})
+        second = self.commands.put({'switch': 'off', 'startup': 'stay'})
+        third = self.commands.put({'switch': 'on'})
+
+        params, waiters = self.commands.take()
+
+        assert params == {'switch': 'on', 'startup': 'stay'}
+        assert waiters == [first, second, third]
+        assert self.commands.busy
+        assert not self.commands.updated_event.is_set()
+
+    def test_changes_while_in_flight_go_in_next_batch(self):
+        self.commands.put({'switch': 'on'})
+        params, waiters = self.commands.take()
+        later = self.commands.put({'switch': 'off'})
+
+        self.commands.resolve(waiters, 'ack')
+
+        assert waiters[0].result() == 'ack'
+        assert not later.done()
+        assert self.commands.take() == ({'switch': 'off'}, [later])
+
+    def test_requeue_keeps_newer_changes(self):
+        first = self.commands.put({'switch': 'on', 'pulse': 'off'})
+        params, waiters = self.commands.take()
+        second = self.commands.put({'switch': 'off'})
+
+        self.commands.requeue(params, waiters)
+
+        assert self.commands.take() == (
+            {'switch': 'off', 'pulse': 'off'}, [first, second])
+
+    def test_channels_are_merged_by_outlet(self):
+        self.commands.put({'switches': [{'outlet': 0, 'switch': 'on'},
+                                        {'outlet': 2, 'switch': 'on'}]})
+        self.commands.put({'switches': [{'outlet': 0, 'switch': 'off'},
+                                        {'outlet': 1, 'switch': 'on'}]})
+
+        params, waiters = self.commands.take()
+
+        assert params == {'switches': [{'outlet': 0, 'switch': 'off'},
+                                       {'outlet': 1, 'switch': 'on'},
+                                       {'outlet': 2, 'switch': 'on'}]}
+
+    def test_merge_params_keeps_other_channels(self):
+        params = {'switches': [{'outlet': 0, 'switch': 'off'},
+                               {'outlet': 1, 'switch': 'off'}],
+                  'startup': 'off'}
+
+        merged = merge_params(params, {
+            'switches': [{'outlet': 1, 'switch': 'on'}], 'startup': 'on'})
+
+        assert merged == {'switches': [{'outlet': 0, 'switch': 'off'},
+                                       {'outlet': 1, 'switch': 'on'}],
+                          'startup': 'on'}
+        assert params['switches'][1]['switch'] == 'off'
+
+    def test_unawaited_failure_is_not_reported(self):
+        errors = []
+        self.loop.set_exception_handler(
+            lambda loop, context: errors.append(context))
+
+        self.commands.put({'switch': 'on'})
+        params, waiters = self.commands.take()
+        self.commands.fail(waiters, ValueError('rejected'))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        del waiters
+        gc.collect()
+
+        assert errors == []
+
+    def test_fail_and_cancel(self):
+        failed = self.commands.put({'switch': 'on'})
+        params, waiters = self.commands.take()
+        cancelled = self.commands.put({'switch': 'off'})
+
+        self.commands.fail(waiters, ValueError('rejected'))
+        self.commands.cancel()
+
+        assert isinstance(failed.exception(), ValueError)
+        assert cancelled.cancelled()
+        assert not self.commands.busy
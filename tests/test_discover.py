@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.discover` module."""
+
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from pysonofflan import Discover, DiscoveryCache, ScanPlanner
+from pysonofflan.simulator import SimulatedDevice
+
+
+class TestDiscover(unittest.TestCase):
+    """Tests for asyncio based network discovery."""
+
+    def setUp(self):
+        """Start a listener on loopback to stand in for a device."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(
+            lambda reader, writer: writer.close(), '127.0.0.1', 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        patcher = mock.patch.object(Discover, 'SONOFF_PORT', self.port)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    def test_discover_finds_open_port(self):
+        devices = self.loop.run_until_complete(
+            Discover.discover(network='127.0.0.0/29', timeout=0.2))
+        assert devices == {'127.0.0.1': '127.0.0.1'}
+
+    def test_discover_does_not_use_threads(self):
+        with mock.patch('threading.Thread') as thread:
+            self.loop.run_until_complete(
+                Discover.discover(network='127.0.0.0/28', concurrency=4,
+                                  timeout=0.2))
+        thread.assert_not_called()
+
+    def test_probe_ip_closed_port(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        found = self.loop.run_until_complete(
+            Discover.probe_ip(mock.Mock(), '127.0.0.1', timeout=0.2))
+        assert found is False
+
+    def test_iter_discover_yields_hits(self):
+        async def collect():
+            return [hit async for hit in Discover.iter_discover(
+                '127.0.0.0/29', timeout=0.2)]
+
+        hits = self.loop.run_until_complete(collect())
+        assert hits == [('127.0.0.1', None)]
+
+    def test_iter_discover_stops_early(self):
+        async def first():
+            async for hit in Discover.iter_discover('127.0.0.0/24',
+                                                    concurrency=2,
+                                                    timeout=0.2):
+                return hit
+
+        hit = self.loop.run_until_complete(first())
+        assert hit == ('127.0.0.1', None)
+
+
+class TestDiscoverConfirm(unittest.TestCase):
+    """Tests for discovery confirming device identity by handshake."""
+
+    def setUp(self):
+        """Start a simulated device answering the userOnline handshake."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.device = SimulatedDevice(device_id='100040e943')
+        port = self.loop.run_until_complete(self.device.start())
+        patcher = mock.patch.object(Discover, 'SONOFF_PORT', port)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.device.stop())
+        self.loop.close()
+
+    def test_discover_confirm_returns_device_ids(self):
+        devices = self.loop.run_until_complete(Discover.discover(
+            network='127.0.0.0/30', timeout=0.2, confirm=True))
+        assert devices == {'127.0.0.1': '100040e943'}
+
+    def test_device_announcing_params_first(self):
+        self.device.hello_first = True
+
+        device_id = self.loop.run_until_complete(
+            Discover.get_device_id(mock.Mock(), '127.0.0.1', timeout=1))
+
+        assert device_id == '100040e943'
+
+    def test_confirm_drops_other_services(self):
+        other = self.loop.run_until_complete(asyncio.start_server(
+            lambda reader, writer: writer.close(), '127.0.0.2',
+            Discover.SONOFF_PORT))
+        try:
+            devices = self.loop.run_until_complete(Discover.discover(
+                network='127.0.0.0/30', timeout=0.2, confirm=True))
+        finally:
+            other.close()
+            self.loop.run_until_complete(other.wait_closed())
+        assert devices == {'127.0.0.1': '100040e943'}
+
+    def test_find_device_uses_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiscoveryCache(os.path.join(directory, 'devices.json'))
+            cache.set('100040e943', '127.0.0.1')
+
+            with mock.patch.object(Discover, 'iter_discover') as scan:
+                host = self.loop.run_until_complete(
+                    Discover.find_device('100040E943', cache=cache))
+
+        assert host == '127.0.0.1'
+        scan.assert_not_called()
+
+    def test_find_device_rescans_stale_address(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiscoveryCache(os.path.join(directory, 'devices.json'))
+            cache.set('100040e943', '127.0.0.3')
+
+            host = self.loop.run_until_complete(Discover.find_device(
+                '100040e943', network='127.0.0.0/30', cache=cache,
+                timeout=0.2))
+
+            assert host == '127.0.0.1'
+            assert DiscoveryCache(cache.path).get('100040e943') == \
+                '127.0.0.1'
+
+
+class TestScanPlanner(unittest.TestCase):
+    """Tests for lazy multi-network scan planning."""
+
+    def test_skips_network_and_broadcast(self):
+        addresses = [str(ip) for ip in ScanPlanner(['10.0.0.0/30'])]
+        assert addresses == ['10.0.0.1', '10.0.0.2']
+
+    def test_single_host_network(self):
+        addresses = [str(ip) for ip in ScanPlanner(['10.0.0.7/32'])]
+        assert addresses == ['10.0.0.7']
+
+    def test_interleaves_networks_with_exclusions(self):
+        planner = ScanPlanner(['10.0.0.0/29', '10.1.0.0/30'],
+                              exclude=['10.0.0.2', '10.0.0.4/30'])
+        addresses = [str(ip) for ip in planner]
+        assert addresses == ['10.0.0.1', '10.1.0.1', '10.0.0.3', '10.1.0.2']
+
+    def test_large_network_is_lazy(self):
+        addresses = iter(ScanPlanner(['10.0.0.0/8']))
+        assert str(next(addresses)) == '10.0.0.1'
+
+    def test_rate_limit_per_network(self):
+        loop = asyncio.new_event_loop()
+        planner = ScanPlanner(['10.0.0.0/24', '10.1.0.0/24'], rate=50)
+        start = time.monotonic()
+
+        async def wait_all():
+            for ip in ['10.0.0.1', '10.1.0.1', '10.0.0.2', '10.1.0.2',
+                       '10.0.0.3']:
+                await planner.wait(ip)
+
+        loop.run_until_complete(wait_all())
+        loop.close()
+        elapsed = time.monotonic() - start
+        assert 0.04 <= elapsed < 0.2
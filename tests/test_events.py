@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.events` module."""
+
+import asyncio
+import unittest
+
+from pysonofflan.changes import ChangeTracker, ParamChange
+from pysonofflan.events import EventStream, OverflowPolicy
+
+
+def power(old, new):
+    return ParamChange('power', old, new)
+
+
+class TestEventStream(unittest.TestCase):
+    """Tests for bounded event streams and their overflow policies."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def read_all(self, stream):
+        async def read():
+            return [change async for change in stream]
+
+        stream.close()
+        return self.loop.run_until_complete(read())
+
+    def test_drop_oldest(self):
+        stream = EventStream(maxsize=2)
+
+        for value in range(4):
+            assert stream.offer(power(value, value + 1))
+
+        assert stream.dropped == 2
+        assert self.read_all(stream) == [power(2, 3), power(3, 4)]
+
+    def test_coalesce_latest(self):
+        stream = EventStream(maxsize=2, overflow='coalesce_latest')
+
+        stream.offer(power('1', '2'))
+        stream.offer(ParamChange('switch', 'off', 'on'))
+        stream.offer(power('2', '3'))
+        stream.offer(ParamChange('current', '0', '1'))
+
+        assert self.read_all(stream) == [
+            power('1', '3'), ParamChange('current', '0', '1')]
+
+    def test_block_waits_for_consumer(self):
+        stream = EventStream(maxsize=1, overflow=OverflowPolicy.BLOCK)
+
+        full = EventStream(maxsize=1, overflow=OverflowPolicy.BLOCK)
+        assert full.offer(power(0, 1))
+        assert not full.offer(power(1, 2))
+
+        async def produce():
+            for value in range(3):
+                await stream.put(power(value, value + 1))
+            stream.close()
+
+        async def consume():
+            changes = []
+            async for change in stream:
+                await asyncio.sleep(0.01)
+                changes.append(change)
+            return changes
+
+        changes = self.loop.run_until_complete(
+            asyncio.gather(produce(), consume()))[1]
+
+        assert changes == [power(0, 1), power(1, 2), power(2, 3)]
+        assert stream.dropped == 0
+
+    def test_blocked_stream_does_not_delay_others(self):
+        tracker = ChangeTracker()
+        blocked = EventStream(maxsize=1, overflow='block',
+                              on_close=tracker.remove_stream)
+        dropping = EventStream(['power'], maxsize=1)
+        tracker.add_stream(blocked)
+        tracker.add_stream(dropping)
+
+        changes = tracker.update({'power': '1', 'switch': 'on'})
+        self.loop.run_until_complete(tracker.notify('device', changes))
+
+        assert list(dropping.queue) == [power(None, '1')]
+        assert list(blocked.queue) == [power(None, '1')]
+        assert list(blocked.backlog) == [
+            ParamChange('switch', None, 'on')]
+
+        assert self.read_all(blocked) == [
+            power(None, '1'), ParamChange('switch', None, 'on')]
+        assert tracker.streams == [dropping]
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            EventStream(maxsize=0)
+        with self.assertRaises(ValueError):
+            EventStream(overflow='newest')
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.fleet` module."""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from pysonofflan import SonoffFleet
+from pysonofflan.simulator import (SimulatedDevice, start_devices,
+                                   stop_devices)
+
+
+class TestSonoffFleet(unittest.TestCase):
+    """Tests for driving several devices on one loop."""
+
+    def setUp(self):
+        self.fleet = SonoffFleet(timeout=2)
+        self.devices = self.fleet.run_until_complete(start_devices(3))
+        for device in self.devices:
+            self.fleet.add_device('127.0.0.1', port=device.port)
+
+    def tearDown(self):
+        self.fleet.run_until_complete(self.fleet.shutdown())
+        self.fleet.run_until_complete(stop_devices(self.devices))
+        self.fleet.close()
+
+    def test_connect_all(self):
+        available = self.fleet.run_until_complete(
+            self.fleet.connect_all(timeout=5))
+        assert available == {'1000000000': True, '1000000001': True,
+                             '1000000002': True}
+
+    def test_turn_on_selected_devices(self):
+        self.fleet.run_until_complete(self.fleet.connect_all(timeout=5))
+        results = self.fleet.run_until_complete(
+            self.fleet.turn_on(['1000000000', '1000000002']))
+        self.fleet.run_until_complete(asyncio.sleep(0.2))
+
+        assert sorted(results) == ['1000000000', '1000000002']
+        assert all(isinstance(rtt, float) for rtt in results.values())
+
+        state = self.fleet.state()
+        assert state['1000000000']['params']['switch'] == 'on'
+        assert state['1000000001']['params']['switch'] == 'off'
+        assert state['1000000002']['params']['switch'] == 'on'
+        assert [device.params['switch'] for device in self.devices] == \
+            ['on', 'off', 'on']
+
+    def test_offline_device_times_out(self):
+        closed = SimulatedDevice()
+        port = self.fleet.run_until_complete(closed.start())
+        self.fleet.run_until_complete(closed.stop())
+        self.fleet.add_device('localhost', port=port)
+        self.fleet.run_until_complete(self.fleet.connect_all(timeout=1))
+
+        results = self.fleet.run_until_complete(
+            self.fleet.turn_on(timeout=0.5))
+
+        assert isinstance(results['1000000000'], float)
+        assert isinstance(results['localhost'], asyncio.TimeoutError)
+
+    def test_turn_off_waits_for_acknowledgement(self):
+        self.fleet.run_until_complete(self.fleet.connect_all(timeout=5))
+        switch = self.fleet.devices[0]
+
+        rtt = self.fleet.run_until_complete(switch.turn_off(timeout=2))
+
+        assert 0 <= rtt < 2
+        assert self.devices[0].params['switch'] == 'off'
+        assert not switch.commands.busy
+
+    def test_burst_is_sent_as_one_message(self):
+        switch = self.fleet.devices[0]
+        toggles = [switch.update_params({'switch': state})
+                   for state in ['on', 'off', 'on']]
+
+        self.fleet.run_until_complete(asyncio.gather(*toggles))
+
+        assert self.devices[0].updates_received == 1
+        assert self.devices[0].params['switch'] == 'on'
+
+    def test_snapshot_restores_stale_state(self):
+        self.fleet.run_until_complete(self.fleet.connect_all(timeout=5))
+        self.fleet.run_until_complete(self.fleet.turn_on(['1000000001']))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot.json')
+            self.fleet.save_snapshot(path)
+            restarted = SonoffFleet(loop=self.fleet.loop, timeout=2)
+            devices = restarted.restore_snapshot(path)
+
+        try:
+            state = restarted.state()
+            assert len(devices) == 3
+            assert state['1000000001']['stale']
+            assert state['1000000001']['params'] == {'switch': 'on'}
+            assert state['1000000000']['last_seen'] is not None
+
+            self.devices[1].params['switch'] = 'off'
+            self.fleet.run_until_complete(restarted.connect_all(timeout=5))
+
+            state = restarted.state()
+            assert not any(device['stale'] for device in state.values())
+            assert state['1000000001']['params'] == {'switch': 'off'}
+        finally:
+            self.fleet.run_until_complete(restarted.shutdown())
+
+    def test_snapshot_does_not_replace_newer_state(self):
+        self.fleet.run_until_complete(self.fleet.connect_all(timeout=5))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot.json')
+            self.fleet.save_snapshot(path)
+            self.fleet.run_until_complete(
+                self.fleet.turn_on(['1000000001']))
+            devices = self.fleet.restore_snapshot(path)
+
+        state = self.fleet.state()
+        assert devices == []
+        assert not state['1000000001']['stale']
+        assert state['1000000001']['params'] == {'switch': 'on'}
+
+    def test_stats(self):
+        self.fleet.run_until_complete(self.fleet.connect_all(timeout=5))
+        self.fleet.run_until_complete(self.fleet.turn_on(['1000000000']))
+
+        stats = self.fleet.stats()['1000000000']
+        assert stats['connections_attempted'] == 1
+        assert stats['connections_failed'] == 0
+        assert stats['messages_sent'] == 2
+        assert stats['command_rtt_seconds']['count'] == 1
+        assert stats['handshake_seconds']['count'] == 1
+        assert 0 < stats['handshake_seconds']['max'] < 5
+        assert stats['ack_timeouts'] == 0
+
+        text = self.fleet.prometheus_text()
+        assert text.count(
+            '# TYPE pysonofflan_messages_sent_total counter') == 1
+        assert text.count('pysonofflan_messages_sent_total{') == 3
+
+    def test_devices_share_reconnect_policy(self):
+        policy = self.fleet.reconnect_policy
+        policy.max_handshakes = 1
+
+        available = self.fleet.run_until_complete(
+            self.fleet.connect_all(timeout=5))
+
+        assert all(available.values())
+        assert all(device.reconnect_policy is policy
+                   for device in self.fleet.devices)
+        assert policy.semaphore is not None
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.mdns` module."""
+
+import asyncio
+import json
+import struct
+import unittest
+
+from pysonofflan import MDNSDiscovery
+from pysonofflan.mdns import (TYPE_A, build_announcement, encode_name,
+                              parse_packet, read_name)
+
+
+def a_record_packet(rdata):
+    """Response with a single A record holding the given rdata."""
+    return (struct.pack('!HHHHHH', 0, 0x8400, 0, 1, 0, 0)
+            + encode_name('eWeLink_100040e943.local.')
+            + struct.pack('!HHIH', TYPE_A, 1, 120, len(rdata)) + rdata)
+
+
+class FakeResponder(asyncio.DatagramProtocol):
+    """Answers eWeLink service queries like a device would."""
+
+    def __init__(self, announcement):
+        self.announcement = announcement
+        self.transport = None
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        self.transport.sendto(self.announcement, addr)
+
+
+class TestMDNSDiscovery(unittest.TestCase):
+    """Tests for the mDNS discovery listener on loopback."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.discovery = MDNSDiscovery(address='127.0.0.1', port=0,
+                                       loop=self.loop)
+        self.loop.run_until_complete(self.discovery.start())
+
+    def tearDown(self):
+        self.discovery.stop()
+        self.loop.close()
+
+    def send(self, packet):
+        transport, _ = self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol,
+                remote_addr=('127.0.0.1', self.discovery.port)))
+        transport.sendto(packet)
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        transport.close()
+
+    def test_query_fake_responder(self):
+        announcement = build_announcement(
+            '100040e943', '192.168.0.77',
+            txt={'type': 'plug', 'data1': json.dumps({'switch': 'on'})})
+        transport, responder = self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(
+                lambda: FakeResponder(announcement),
+                local_addr=('127.0.0.1', 0)))
+
+        self.discovery.query(transport.get_extra_info('sockname'))
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        transport.close()
+
+        assert responder.queries == 1
+        device = self.discovery.devices['100040e943']
+        assert device.host == '192.168.0.77'
+        assert device.port == 8081
+        assert device.txt['type'] == 'plug'
+        assert device.params == {'switch': 'on'}
+
+    def test_announcement_and_goodbye(self):
+        updated = []
+
+        async def callback(device):
+            updated.append(device.device_id)
+
+        self.discovery.callback_after_update = callback
+
+        self.send(build_announcement('100040e943', '192.168.0.77'))
+        assert list(self.discovery.devices) == ['100040e943']
+        assert updated == ['100040e943']
+
+        self.send(build_announcement('100040e943', '192.168.0.77', ttl=0))
+        assert self.discovery.devices == {}
+
+    def test_malformed_packet_ignored(self):
+        self.send(b'\x00\x01')
+        assert self.discovery.devices == {}
+
+    def test_invalid_address_record_ignored(self):
+        self.send(a_record_packet(b'\x0a\x00\x00\x02\x00\x00'))
+        assert self.discovery.hosts == {}
+
+
+class TestMDNSParsing(unittest.TestCase):
+    """Tests for the DNS packet parser."""
+
+    def test_read_compressed_name(self):
+        data = b'\x05local\x00\x08_ewelink\xc0\x00'
+        assert read_name(data, 7) == ('_ewelink.local.', len(data))
+
+    def test_parse_announcement(self):
+        records = parse_packet(build_announcement('100040e943', '10.0.0.2'))
+        assert [record.type for record in records] == [12, 33, 16, 1]
+        assert records[3].data == '10.0.0.2'
+
+    def test_invalid_address_record_length(self):
+        records = parse_packet(a_record_packet(b'\x0a\x00\x00\x02'))
+        assert records[0].data == '10.0.0.2'
+        for rdata in (b'\x0a\x00', b'\x0a\x00\x00\x02\x00\x00'):
+            with self.assertRaises(ValueError):
+                parse_packet(a_record_packet(rdata))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.messages` module."""
+
+import asyncio
+import unittest
+
+from pysonofflan.messages import (MessageDispatcher, ResponseMessage,
+                                  UnknownMessage, UpdateMessage,
+                                  parse_message)
+
+
+class TestMessages(unittest.TestCase):
+    """Tests for typed message parsing and dispatch."""
+
+    def test_parse_response(self):
+        message = parse_message({'error': 0, 'sequence': '1',
+                                 'deviceid': '100040e943'})
+
+        assert isinstance(message, ResponseMessage)
+        assert message.ok
+        assert message.sequence == '1'
+        assert message.device_id == '100040e943'
+
+    def test_parse_update(self):
+        message = parse_message({'action': 'update', 'deviceid': '100040e943',
+                                 'params': {'switch': 'on'}})
+
+        assert isinstance(message, UpdateMessage)
+        assert message.params == {'switch': 'on'}
+
+    def test_parse_unknown(self):
+        assert isinstance(parse_message({'action': 'reboot'}), UnknownMessage)
+        assert isinstance(parse_message({'deviceid': '100040e943'}),
+                          UnknownMessage)
+        assert isinstance(parse_message(['update']), UnknownMessage)
+
+    def test_dispatch_by_type(self):
+        loop = asyncio.new_event_loop()
+        handled = []
+
+        async def handle_update(message):
+            handled.append(('update', message))
+
+        async def handle_other(message):
+            handled.append(('other', message))
+
+        dispatcher = MessageDispatcher(handle_other)
+        dispatcher.register(UpdateMessage, handle_update)
+        update = parse_message({'action': 'update', 'params': {}})
+        unknown = parse_message({'action': 'reboot'})
+
+        try:
+            loop.run_until_complete(dispatcher.dispatch(update))
+            loop.run_until_complete(dispatcher.dispatch(unknown))
+        finally:
+            loop.close()
+
+        assert handled == [('update', update), ('other', unknown)]
+
+    def test_dispatch_without_handler(self):
+        loop = asyncio.new_event_loop()
+        try:
+            dispatched = loop.run_until_complete(MessageDispatcher().dispatch(
+                parse_message({'action': 'reboot'})))
+        finally:
+            loop.close()
+
+        assert not dispatched
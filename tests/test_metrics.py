@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.metrics` module."""
+
+import asyncio
+import unittest
+
+from pysonofflan import MetricsRegistry, MetricsServer
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """Tests for counters, histograms and their exports."""
+
+    def setUp(self):
+        self.registry = MetricsRegistry({'host': '192.168.1.50'})
+
+    def test_counter_is_created_once(self):
+        self.registry.counter('messages_received').inc()
+        self.registry.counter('messages_received').inc(2)
+
+        assert self.registry.stats() == {'messages_received': 3}
+
+    def test_histogram_stats(self):
+        histogram = self.registry.histogram('command_rtt_seconds')
+        for value in [0.02, 0.04, 0.3]:
+            histogram.observe(value)
+
+        stats = self.registry.stats()['command_rtt_seconds']
+        assert stats['count'] == 3
+        assert stats['min'] == 0.02
+        assert stats['max'] == 0.3
+        assert abs(stats['mean'] - 0.12) < 1e-9
+
+    def test_prometheus_text(self):
+        self.registry.counter('ack_timeouts', 'Updates not acknowledged')
+        histogram = self.registry.histogram('ping_rtt_seconds',
+                                            buckets=[0.01, 0.1])
+        histogram.observe(0.005)
+        histogram.observe(0.05)
+        histogram.observe(3)
+
+        lines = self.registry.to_prometheus().splitlines()
+
+        assert ('# HELP pysonofflan_ack_timeouts_total Updates not '
+                'acknowledged') in lines
+        assert '# TYPE pysonofflan_ack_timeouts_total counter' in lines
+        assert 'pysonofflan_ack_timeouts_total{host="192.168.1.50"} 0.0' \
+            in lines
+        assert '# TYPE pysonofflan_ping_rtt_seconds histogram' in lines
+        assert ('pysonofflan_ping_rtt_seconds_bucket'
+                '{host="192.168.1.50",le="0.01"} 1.0') in lines
+        assert ('pysonofflan_ping_rtt_seconds_bucket'
+                '{host="192.168.1.50",le="0.1"} 2.0') in lines
+        assert ('pysonofflan_ping_rtt_seconds_bucket'
+                '{host="192.168.1.50",le="+Inf"} 3.0') in lines
+        assert ('pysonofflan_ping_rtt_seconds_count'
+                '{host="192.168.1.50"} 3.0') in lines
+
+    def test_server(self):
+        loop = asyncio.new_event_loop()
+        self.registry.counter('messages_sent').inc()
+        server = MetricsServer(self.registry.to_prometheus, port=0)
+
+        async def get(path):
+            reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                           server.port)
+            writer.write(('GET %s HTTP/1.0\r\n\r\n' % path).encode())
+            response = await reader.read()
+            writer.close()
+            return response.decode()
+
+        try:
+            loop.run_until_complete(server.start())
+            metrics = loop.run_until_complete(get('/metrics'))
+            missing = loop.run_until_complete(get('/other'))
+        finally:
+            loop.run_until_complete(server.stop())
+            loop.close()
+
+        assert metrics.startswith('HTTP/1.0 200 OK')
+        assert 'pysonofflan_messages_sent_total{host="192.168.1.50"} 1.0' \
+            in metrics
+        assert missing.startswith('HTTP/1.0 404 Not Found')
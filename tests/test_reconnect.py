@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.reconnect` module."""
+
+import asyncio
+import unittest
+
+from pysonofflan import ReconnectPolicy
+
+
+class TestReconnectPolicy(unittest.TestCase):
+    """Tests for backoff delays and the handshake limit."""
+
+    def test_exponential_backoff_without_jitter(self):
+        policy = ReconnectPolicy(base=0.5, factor=2, cap=5, jitter=False)
+
+        assert [policy.delay(retry) for retry in range(6)] == \
+            [0.5, 1, 2, 4, 5, 5]
+        assert policy.delay(10000) == 5
+
+    def test_full_jitter(self):
+        policy = ReconnectPolicy(base=1, cap=8, seed=1)
+
+        for retry in range(10):
+            delays = [policy.delay(retry) for _ in range(50)]
+            upper = min(8, 2 ** retry)
+            assert all(0 <= delay <= upper for delay in delays)
+            assert len(set(delays)) == 50
+
+    def test_seed_makes_delays_repeatable(self):
+        first = ReconnectPolicy(seed=42)
+        second = ReconnectPolicy(seed=42)
+
+        assert [first.delay(3) for _ in range(5)] == \
+            [second.delay(3) for _ in range(5)]
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            ReconnectPolicy(factor=0.5)
+        with self.assertRaises(ValueError):
+            ReconnectPolicy(max_handshakes=0)
+
+    def test_handshake_limit(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        policy = ReconnectPolicy(max_handshakes=2)
+        active = []
+        peak = []
+
+        async def handshake():
+            async with policy.handshake():
+                active.append(1)
+                peak.append(len(active))
+                await asyncio.sleep(0.01)
+                active.pop()
+
+        try:
+            loop.run_until_complete(
+                asyncio.gather(*(handshake() for _ in range(6))))
+        finally:
+            loop.close()
+
+        assert max(peak) == 2
+        assert len(peak) == 6
+
+    def test_no_handshake_limit(self):
+        loop = asyncio.new_event_loop()
+        policy = ReconnectPolicy()
+
+        async def handshake():
+            async with policy.handshake():
+                pass
+
+        try:
+            loop.run_until_complete(handshake())
+        finally:
+            loop.close()
+
+        assert policy.semaphore is None
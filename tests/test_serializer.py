@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.serializer` module."""
+
+import unittest
+
+from pysonofflan import SonoffLANModeClient
+from pysonofflan.serializer import SERIALIZERS, get_serializer
+
+
+class TestSerializer(unittest.TestCase):
+    """Tests for choosing a JSON library."""
+
+    def test_fastest_available_is_default(self):
+        for name in ['orjson', 'ujson', 'json']:
+            if name in SERIALIZERS:
+                break
+
+        assert get_serializer().name == name
+        assert SonoffLANModeClient('127.0.0.1', None).serializer.name == name
+
+    def test_unavailable_library(self):
+        with self.assertRaises(ValueError):
+            get_serializer('simplejson')
+
+    def test_round_trip(self):
+        payload = SonoffLANModeClient.get_update_payload(
+            '100040e943', {'switch': 'on', 'pulseWidth': 500})
+
+        for name in SERIALIZERS:
+            serializer = get_serializer(name)
+            encoded = serializer.dumps(payload)
+
+            assert isinstance(encoded, str)
+            assert serializer.loads(encoded) == payload
+            assert get_serializer('json').loads(encoded) == payload
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.snapshot` module."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pysonofflan import StateSnapshot
+
+
+class TestStateSnapshot(unittest.TestCase):
+    """Tests for the on-disk device state snapshot."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sub', 'snapshot.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_missing_file_is_empty(self):
+        assert StateSnapshot(self.path).load() == []
+
+    def test_round_trip(self):
+        state = {'device_id': '100040e943', 'host': '192.168.0.77',
+                 'port': 8081, 'params': {'switch': 'on'},
+                 'last_seen': 1560000000.5}
+
+        StateSnapshot(self.path).save([state])
+
+        assert StateSnapshot(self.path).load() == [state]
+
+    def test_unsupported_snapshot_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        for content in ['{"version": 99, "devices": []}', '[]', 'not json']:
+            with open(self.path, 'w') as snapshot_file:
+                snapshot_file.write(content)
+
+            assert StateSnapshot(self.path).load() == []
+
+    def test_default_path_from_environment(self):
+        with mock.patch.dict(os.environ, {'PYSONOFFLAN_SNAPSHOT': self.path}):
+            assert StateSnapshot().path == self.path
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.sonoffdevice` module against simulated devices."""
+
+import asyncio
+import logging
+import unittest
+
+from pysonofflan import (CircuitBreaker, ReconnectPolicy, SonoffSwitch,
+                         TelemetryBuffer)
+from pysonofflan.simulator import SimulatedDevice
+
+
+class TestSonoffDevice(unittest.TestCase):
+    """Tests for device sessions against a simulated device."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.switch = None
+        self.updates = []
+
+    def tearDown(self):
+        if self.switch is not None:
+            tasks = [task for task in self.switch.tasks
+                     if isinstance(task, asyncio.Future)]
+            self.switch.shutdown_event_loop()
+            if tasks:
+                self.loop.run_until_complete(asyncio.wait(tasks))
+        self.loop.run_until_complete(self.device.stop())
+        self.loop.close()
+
+    def connect(self, switch_kwargs=None, **kwargs):
+        self.device = SimulatedDevice(device_id='100040e943', **kwargs)
+        port = self.loop.run_until_complete(self.device.start())
+
+        async def callback(device):
+            self.updates.append(dict(device.params))
+
+        self.switch = SonoffSwitch('127.0.0.1', port=port, loop=self.loop,
+                                   callback_after_update=callback,
+                                   **(switch_kwargs or {}))
+        self.wait_until(lambda: self.switch.available)
+
+    def wait_until(self, condition, timeout=5):
+        async def wait():
+            while not condition():
+                await asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(asyncio.wait_for(wait(), timeout))
+
+    def test_handshake_populates_state(self):
+        self.connect(params={'switch': 'on', 'startup': 'off'})
+
+        assert self.switch.device_id == '100040e943'
+        assert self.switch.is_on
+        assert self.updates[-1] == {'switch': 'on', 'startup': 'off'}
+
+    def test_simulator_does_not_compress(self):
+        self.connect()
+
+        assert self.switch.client.websocket.extensions == []
+
+    def test_device_initiated_update(self):
+        self.connect()
+
+        self.loop.run_until_complete(
+            self.device.push_update({'switch': 'on'}))
+        self.wait_until(lambda: self.switch.is_on)
+
+        assert self.updates[-1] == {'switch': 'on'}
+
+    def test_turn_on_with_latency(self):
+        self.connect(latency=0.05)
+
+        rtt = self.loop.run_until_complete(self.switch.turn_on(timeout=2))
+
+        assert rtt >= 0.05
+        assert self.device.params['switch'] == 'on'
+
+    def test_callback_can_await_commands(self):
+        self.device = SimulatedDevice(device_id='100040e943')
+        port = self.loop.run_until_complete(self.device.start())
+        rtts = []
+
+        async def switch_on(device):
+            if device.available and device.is_off:
+                rtts.append(await device.turn_on())
+
+        self.switch = SonoffSwitch('127.0.0.1', port=port, loop=self.loop,
+                                   callback_after_update=switch_on)
+        self.wait_until(lambda: rtts)
+
+        assert self.device.params['switch'] == 'on'
+        assert self.switch.available
+        assert self.device.handshakes == 1
+
+    def test_unacknowledged_update_times_out(self):
+        self.connect(ack=False)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(self.switch.turn_on(timeout=0.2))
+
+    def test_reconnects_after_disconnect(self):
+        self.connect()
+
+        self.loop.run_until_complete(self.device.disconnect())
+        self.wait_until(lambda: not self.switch.available)
+        self.wait_until(lambda: self.switch.available)
+
+        assert self.device.handshakes == 2
+
+    def test_update_resent_after_disconnect(self):
+        self.connect(disconnect_after=2)
+
+        rtt = self.loop.run_until_complete(self.switch.turn_on(timeout=5))
+
+        assert rtt >= 0
+        assert self.device.params['switch'] == 'on'
+        assert self.device.handshakes == 2
+
+    def test_subscribers_notified_of_their_params(self):
+        self.connect(params={'switch': 'on', 'power': '10.5'})
+        changes = []
+
+        async def power_changed(device, change):
+            changes.append(change)
+
+        self.switch.subscribe(power_changed, 'power')
+        self.loop.run_until_complete(
+            self.device.push_update({'switch': 'off'}))
+        self.loop.run_until_complete(
+            self.device.push_update({'power': '0.0'}))
+        self.wait_until(lambda: changes)
+
+        assert changes == [('power', '10.5', '0.0')]
+        assert self.switch.params == {'switch': 'off', 'power': '0.0'}
+
+    def test_slow_event_consumer_does_not_stall_device(self):
+        self.connect()
+        events = self.switch.events('switch', maxsize=1)
+
+        for state in ['on', 'off', 'on']:
+            self.loop.run_until_complete(self.switch.send_params(
+                {'switch': state}, timeout=2))
+
+        async def read():
+            return [change async for change in events]
+
+        self.loop.run_until_complete(self.switch.stop())
+        changes = self.loop.run_until_complete(read())
+
+        assert changes == [('switch', 'off', 'on')]
+        assert events.dropped == 2
+        assert self.switch.changes.streams == []
+
+    def test_unread_blocking_stream_does_not_stall_device(self):
+        self.connect(params={'switch': 'off', 'power': '0.0'})
+        events = self.switch.events('power', maxsize=1, overflow='block')
+
+        for power in ['1.0', '2.0', '3.0']:
+            self.loop.run_until_complete(
+                self.device.push_update({'power': power}))
+        self.wait_until(lambda: self.switch.params['power'] == '3.0')
+
+        rtt = self.loop.run_until_complete(self.switch.turn_on(timeout=3))
+
+        async def read():
+            return [change async for change in events]
+
+        self.loop.run_until_complete(self.switch.stop())
+        changes = self.loop.run_until_complete(read())
+
+        assert rtt >= 0
+        assert self.device.params['switch'] == 'on'
+        assert changes == [('power', '0.0', '1.0'), ('power', '1.0', '2.0'),
+                           ('power', '2.0', '3.0')]
+        assert events.dropped == 0
+
+    def test_power_readings_recorded(self):
+        telemetry = TelemetryBuffer(capacity=10)
+        self.connect(params={'switch': 'on', 'power': '10.5'},
+                     switch_kwargs={'telemetry': telemetry})
+
+        self.loop.run_until_complete(
+            self.device.push_update({'power': '12.0', 'voltage': '231'}))
+        self.wait_until(lambda: len(telemetry) == 2)
+
+        assert list(telemetry.values('power')) == [10.5, 12]
+        assert telemetry.values('voltage')[-1] == 231
+
+    def test_stats_record_ping_rtt(self):
+        self.connect(switch_kwargs={'ping_interval': 0.05})
+
+        self.wait_until(
+            lambda: self.switch.stats()['ping_rtt_seconds']['count'] > 0)
+
+        stats = self.switch.stats()
+        assert stats['connections_attempted'] == 1
+        assert stats['messages_received'] >= 2
+        assert 0 <= stats['ping_rtt_seconds']['max'] < 1
+
+    def test_message_logging_can_be_disabled(self):
+        logger = logging.getLogger('tests.quiet_device')
+
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            self.connect(switch_kwargs={'logger': logger,
+                                        'log_messages': False})
+            self.loop.run_until_complete(self.switch.turn_on(timeout=2))
+            self.loop.run_until_complete(
+                self.device.push_update({'switch': 'off'}))
+            self.wait_until(lambda: self.switch.is_off)
+
+        assert not [line for line in logs.output
+                    if 'Message:' in line or 'websocket message' in line]
+
+    def test_unknown_messages_are_ignored(self):
+        self.connect()
+
+        self.loop.run_until_complete(
+            self.device.send_frame('{"action": "reboot"}'))
+        self.loop.run_until_complete(self.device.send_frame('not json'))
+        self.loop.run_until_complete(
+            self.device.push_update({'switch': 'on'}))
+        self.wait_until(lambda: self.switch.is_on)
+
+        assert self.switch.stats()['connections_attempted'] == 1
+
+    def test_circuit_breaker_probes_unreachable_device(self):
+        self.device = SimulatedDevice(device_id='100040e943')
+        port = self.loop.run_until_complete(self.device.start())
+        self.loop.run_until_complete(self.device.stop())
+
+        self.switch = SonoffSwitch(
+            '127.0.0.1', port=port, loop=self.loop,
+            reconnect_policy=ReconnectPolicy(base=0.01, jitter=False),
+            circuit_breaker=CircuitBreaker(failure_threshold=2,
+                                           probe_interval=0.05))
+        self.wait_until(lambda: self.switch.circuit_state == 'open')
+        self.wait_until(lambda: self.switch.stats()['circuit_probes'] >= 2)
+
+        stats = self.switch.stats()
+        assert stats['connections_attempted'] == 2
+        assert stats['circuit_state'] == 2
+
+        self.device = SimulatedDevice(device_id='100040e943', port=port)
+        self.loop.run_until_complete(self.device.start())
+        self.wait_until(lambda: self.switch.available)
+
+        assert self.switch.circuit_state == 'closed'
+        assert self.switch.stats()['circuit_opened'] == 1
+
+    def test_unresponsive_host_releases_handshake_slot(self):
+        async def never_respond(reader, writer):
+            await reader.read()
+            writer.close()
+
+        blackhole = self.loop.run_until_complete(
+            asyncio.start_server(never_respond, '127.0.0.1', 0))
+        policy = ReconnectPolicy(base=0.01, max_handshakes=1)
+        stuck = SonoffSwitch(
+            '127.0.0.1', port=blackhole.sockets[0].getsockname()[1],
+            loop=self.loop, timeout=0.2, reconnect_policy=policy)
+
+        try:
+            self.connect(switch_kwargs={'reconnect_policy': policy})
+        finally:
+            self.loop.run_until_complete(stuck.stop())
+            blackhole.close()
+
+        assert stuck.stats()['connections_attempted'] >= 1
+        assert not stuck.available
+
+    def test_start_and_stop_without_blocking(self):
+        self.device = SimulatedDevice(device_id='100040e943')
+        port = self.loop.run_until_complete(self.device.start())
+
+        async def lifecycle():
+            switch = SonoffSwitch('127.0.0.1', port=port, autostart=False)
+            assert not switch.started
+            assert self.device.handshakes == 0
+
+            async with switch:
+                assert switch.started
+                await asyncio.wait_for(switch.client.connected_event.wait(),
+                                       5)
+                await switch.turn_on(timeout=2)
+
+            assert not switch.started
+            assert not switch.available
+
+        self.loop.run_until_complete(lifecycle())
+
+        assert self.device.params['switch'] == 'on'
+        assert self.device.handshakes == 1
+
+    def test_start_on_another_loop_raises(self):
+        self.device = SimulatedDevice(device_id='100040e943')
+        port = self.loop.run_until_complete(self.device.start())
+        switch = SonoffSwitch('127.0.0.1', port=port, autostart=False)
+        other_loop = asyncio.new_event_loop()
+
+        try:
+            with self.assertRaises(RuntimeError):
+                other_loop.run_until_complete(switch.start())
+        finally:
+            other_loop.close()
+
+        assert not switch.started
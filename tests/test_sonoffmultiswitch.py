@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.sonoffmultiswitch` module."""
+
+import asyncio
+import unittest
+
+from pysonofflan import SonoffMultiSwitch
+from pysonofflan.simulator import SimulatedDevice
+
+
+def switches(*states):
+    return [{'outlet': outlet, 'switch': state}
+            for outlet, state in enumerate(states)]
+
+
+class TestSonoffMultiSwitch(unittest.TestCase):
+    """Tests for multi-channel devices against a simulated device."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.device = SimulatedDevice(
+            device_id='100040e944',
+            params={'switches': switches('off', 'off', 'off', 'off')})
+        port = self.loop.run_until_complete(self.device.start())
+        self.switch = SonoffMultiSwitch('127.0.0.1', port=port,
+                                        loop=self.loop)
+        self.wait_until(lambda: self.switch.available)
+
+    def tearDown(self):
+        tasks = [task for task in self.switch.tasks
+                 if isinstance(task, asyncio.Future)]
+        self.switch.shutdown_event_loop()
+        self.loop.run_until_complete(asyncio.wait(tasks))
+        self.loop.run_until_complete(self.device.stop())
+        self.loop.close()
+
+    def wait_until(self, condition, timeout=5):
+        async def wait():
+            while not condition():
+                await asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(asyncio.wait_for(wait(), timeout))
+
+    def test_channels_reported_by_device(self):
+        assert [channel.outlet for channel in self.switch.channels] == [
+            0, 1, 2, 3]
+        assert self.switch.channel(2) is self.switch.channels[2]
+        assert not self.switch.is_on
+
+    def test_scene_change_is_one_update(self):
+        self.loop.run_until_complete(self.switch.set_channels(
+            {0: True, 2: 'on', 3: False}, timeout=2))
+
+        assert self.device.updates_received == 1
+        assert self.device.params['switches'] == switches(
+            'on', 'off', 'on', 'off')
+        assert self.switch.channel(0).is_on
+        assert not self.switch.channel(1).is_on
+        assert self.switch.is_on
+
+    def test_single_channel_keeps_others(self):
+        self.loop.run_until_complete(self.switch.turn_on(timeout=2))
+        self.loop.run_until_complete(
+            self.switch.channel(1).turn_off(timeout=2))
+
+        assert self.device.updates_received == 2
+        assert self.device.params['switches'] == switches(
+            'on', 'off', 'on', 'on')
+        assert [channel.state for channel in self.switch.channels] == [
+            'ON', 'OFF', 'ON', 'ON']
+
+    def test_invalid_state(self):
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(
+                self.switch.set_channels({0: 'toggle'}))
+
+    def test_no_known_channels(self):
+        self.switch.params = {}
+
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(self.switch.turn_on(timeout=2))
+
+        assert self.device.updates_received == 0
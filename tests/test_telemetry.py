@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `pysonofflan.telemetry` module."""
+
+import math
+import unittest
+
+from pysonofflan import TelemetryBuffer
+from pysonofflan import telemetry as telemetry_module
+
+
+class TestTelemetryBuffer(unittest.TestCase):
+    """Tests for recording and summarising power readings."""
+
+    def setUp(self):
+        self.telemetry = TelemetryBuffer(capacity=4)
+
+    def test_record_parses_readings(self):
+        assert self.telemetry.record(
+            {'switch': 'on', 'power': '12.50', 'voltage': 230, 'current': ''},
+            timestamp=100)
+        assert not self.telemetry.record({'switch': 'off'}, timestamp=101)
+
+        assert len(self.telemetry) == 1
+        assert list(self.telemetry.values('power')) == [12.5]
+        assert list(self.telemetry.values('voltage')) == [230]
+        assert math.isnan(self.telemetry.values('current')[0])
+
+    def test_oldest_readings_are_overwritten(self):
+        for second in range(6):
+            self.telemetry.record({'power': second}, timestamp=second)
+
+        assert len(self.telemetry) == 4
+        assert list(self.telemetry.times()) == [2, 3, 4, 5]
+        assert list(self.telemetry.values('power')) == [2, 3, 4, 5]
+        assert self.telemetry.export()['power'] == [2, 3, 4, 5]
+
+    def test_downsample(self):
+        telemetry = TelemetryBuffer(capacity=10)
+        for second, power in [(0, 10), (30, 20), (59, 30), (60, 5),
+                              (150, 1)]:
+            telemetry.record({'power': power, 'voltage': 230},
+                             timestamp=second)
+        telemetry.record({'voltage': 231}, timestamp=151)
+
+        periods = telemetry.downsample(60)
+
+        assert [period['start'] for period in periods] == [0, 60, 120]
+        assert [period['count'] for period in periods] == [3, 1, 2]
+        assert periods[0]['power'] == {'min': 10, 'max': 30, 'avg': 20}
+        assert periods[2]['power'] == {'min': 1, 'max': 1, 'avg': 1}
+        assert periods[2]['voltage']['max'] == 231
+        assert periods[0]['current'] is None
+
+        with self.assertRaises(ValueError):
+            telemetry.downsample(0)
+
+    def test_energy(self):
+        self.telemetry.record({'power': 100}, timestamp=0)
+        self.telemetry.record({'voltage': 230}, timestamp=1800)
+        self.telemetry.record({'power': 100}, timestamp=3600)
+        self.telemetry.record({'power': 300}, timestamp=5400)
+
+        assert self.telemetry.energy() == 200
+
+    @unittest.skipIf(telemetry_module.numpy is None, 'NumPy not installed')
+    def test_to_numpy(self):
+        self.telemetry.record({'power': 1.5}, timestamp=10)
+
+        exported = self.telemetry.to_numpy()
+
+        assert exported['timestamp'].tolist() == [10]
+        assert exported['power'].tolist() == [1.5]